@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+###     Fast access to alignment files in PSICOV format
+###     Alignments are converted into uint8 encoded copies (.binary/*.npy in the
+###     directory of the alignment, amino acids encoded as by CCMpredPy) that are
+###     memory-mapped and preferred over the text alignment when up to date.
+###     Run this script to convert all alignments (or MCMC samples) of a directory.
+# ===============================================================================
+
+### load libraries
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import ccmpred.io.alignment
+import matrix_io
+
+BINARY_DIR = ".binary"
+
+
+def binary_alignment_file(alignment_file):
+    """
+    Path of the binary copy of a text alignment file
+
+    :param alignment_file: path to alignment file
+    :return: path to uint8 .npy file
+    """
+
+    return os.path.join(os.path.dirname(alignment_file), BINARY_DIR, os.path.basename(alignment_file) + ".npy")
+
+
+def current_binary_alignment_file(alignment_file):
+    """
+    Path of the binary copy of a text alignment file if it exists and is not older than the text file
+
+    :param alignment_file: path to alignment file
+    :return: path to .npy file or None
+    """
+
+    npy_file = binary_alignment_file(alignment_file)
+    try:
+        if os.stat(npy_file).st_mtime_ns >= os.stat(alignment_file).st_mtime_ns:
+            return npy_file
+    except OSError:
+        pass
+
+    return None
+
+
+def write_binary_alignment(alignment_file, alignment):
+    """
+    Write the binary copy (uint8 .npy) of a text alignment file
+
+    :param alignment_file: path to alignment file
+    :param alignment: N x L alignment (integer encoded)
+    :return: path to .npy file
+    """
+
+    npy_file = binary_alignment_file(alignment_file)
+    if not os.path.exists(os.path.dirname(npy_file)):
+        os.makedirs(os.path.dirname(npy_file), exist_ok=True)
+
+    matrix_io.replace_atomically(npy_file, lambda f: np.save(f, np.asarray(alignment, dtype=np.uint8)))
+
+    return npy_file
+
+
+def read_alignment(alignment_file):
+    """
+    Read an alignment in PSICOV format, from its binary copy if it is up to date
+
+    :param alignment_file: path to alignment file
+    :return: N x L uint8 alignment (memory-mapped and read-only if read from the binary copy)
+    """
+
+    npy_file = current_binary_alignment_file(alignment_file)
+    if npy_file is not None:
+        return np.load(npy_file, mmap_mode='r')
+
+    return ccmpred.io.alignment.read_msa_psicov(alignment_file)
+
+
+def convert_alignment(alignment_file, force=False):
+
+    if not force and current_binary_alignment_file(alignment_file) is not None:
+        return alignment_file
+
+    alignment = ccmpred.io.alignment.read_msa_psicov(alignment_file)
+    write_binary_alignment(alignment_file, alignment)
+
+    return alignment_file
+
+
+def parse_args():
+    """
+    parse command line arguments
+    :return:
+    """
+
+    parser = argparse.ArgumentParser(description='Write binary copies of all alignments in a directory.')
+    parser.add_argument("input_dir", type=str, help="directory with alignments in PSICOV format")
+    parser.add_argument("--filter", type=str, default=".aln", help="substring of alignment file names")
+    parser.add_argument("--force", action="store_true", default=False, help="also convert files with an up to date binary copy")
+    parser.add_argument("--num-processes", type=int, default=1, help="number of parallel processes")
+
+    args = parser.parse_args()
+
+    return args
+
+def main():
+
+    #parse command line arguments
+    args = parse_args()
+
+    input_files = [input_file for input_file in glob.glob(args.input_dir + "/*" + args.filter + "*")
+                   if os.path.isfile(input_file)]
+    print("Write binary copies of {0} alignments in {1}...".format(len(input_files), args.input_dir))
+
+    with ProcessPoolExecutor(max_workers=args.num_processes) as executor:
+        futures = [executor.submit(convert_alignment, input_file, args.force) for input_file in input_files]
+        for id, future in enumerate(futures):
+            print(str(id + 1) + "/" + str(len(input_files)) + " " + os.path.basename(future.result()))
+
+
+
+if __name__ == '__main__':
+    main()
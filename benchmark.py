@@ -1,168 +1,387 @@
-from collections import Counter
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import copy
 import glob
 import os
-import ccmpred.io.pdb
+import threading
 import ccmpred.io.contactmatrix
 import numpy as np
-import pandas as pd
 import plotly.graph_objs as go
 from plotly.offline import plot as plotly_plot
 import colorlover as cl
+from dataset import EvaluationDataset
+import matrix_io
+from results_cache import ResultsCache
+import statistics_io
+from profiling import Profiler
+import bootstrap
 
 
-class Benchmark():
+def rank_pairs(scores, top=None):
     """
-    Benchmarking contact prediction methods on a dataset
+    Indices of the top ranked residue pairs (decreasing score) for every method
+
+    Only the top pairs per method are selected with a partial sort and then sorted.
+
+    :param scores: scores that are used for ranking (pairs x methods)
+    :param top: number of top ranked pairs (default: all pairs)
+    :return: indices of residue pairs (top x methods)
     """
 
-    def __init__(self, pdb_dir):
-        self.pdb_dir = pdb_dir
-        self.pdb_files = glob.glob(self.pdb_dir +"/*pdb")
+    nr_pairs, nr_methods = scores.shape
+    if top is None or top > nr_pairs:
+        top = nr_pairs
 
-        self.evaluation_data = {}
-        self.ordered_methods = []
-        self.evaluation_statistics = {}
-        self.filter = []
+    neg_scores = -scores
+    if top < nr_pairs:
+        top_pairs = np.argpartition(neg_scores, top - 1, axis=0)[:top]
+    else:
+        top_pairs = np.repeat(np.arange(nr_pairs)[:, np.newaxis], nr_methods, axis=1)
+    order = np.argsort(np.take_along_axis(neg_scores, top_pairs, axis=0), axis=0, kind='stable')
 
-    def __apply_filter(self, protein):
+    return np.take_along_axis(top_pairs, order, axis=0)
 
-        filter_operators = {
-            'greater': np.greater,
-            'less': np.less,
-            'greater_equal': np.greater_equal,
-            'less_equal': np.less_equal,
-            'equal': np.equal,
-            'not_equal': np.not_equal
-        }
 
-        for method_name in self.ordered_methods:
+def compute_metrics_at_ranks(true_class, cb_distance, top_pairs, ranks_L, contact_thr, nr_contacts):
+    """
+    Compute precision, recall and mean error at the given ranks from ranked residue pairs
+
+        error:  0, iff cb_distance <= contact_thr
+                d, d=cb_distance - contact_thr
+
+    :param true_class: binary or boolean vector (pairs)
+    :param cb_distance: Cb distances (pairs)
+    :param top_pairs: indices of residue pairs sorted by decreasing score (top x methods)
+    :param ranks_L: number of top ranked pairs minus one at which metrics are evaluated
+    :param contact_thr: Cb distance threshold defining a contact
+    :param nr_contacts: number of true contacts (for recall)
+    :return: precision, recall and mean error (ranks x methods)
+    """
 
-            mat_file = self.evaluation_data[method_name][protein]
-            mat, meta = ccmpred.io.contactmatrix.read_matrix(mat_file)
+    nr_methods = top_pairs.shape[1]
+    if len(ranks_L) == 0:
+        return np.zeros((0, nr_methods)), np.zeros((0, nr_methods)), np.zeros((0, nr_methods))
 
-            for f in self.filter:
-                filter_res = ccmpred.io.contactmatrix.find_dict_key(f['key'], meta)
-                if not filter_operators[f['operator']](filter_res, f['value']):
-                    print("{0} did not pass filter for {1} {2} {3}: {4}".format(method, f['key'], f['operator'], f['value'], filter_res))
-                    return False
+    cumsum_pred = (np.asarray(ranks_L) + 1)[:, np.newaxis]
+    cumsum_tp = np.cumsum(true_class[top_pairs], axis=0, dtype=np.float64)[ranks_L]
+    error = np.maximum(cb_distance - contact_thr, 0)
+    cumsum_error = np.cumsum(error[top_pairs], axis=0, dtype=np.float64)[ranks_L]
 
-        return True
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = cumsum_tp / cumsum_pred
+        recall = cumsum_tp / nr_contacts
+        mean_error = cumsum_error / cumsum_pred
 
-    def __get_distances(self, pdb_file, L):
+    return precision, recall, mean_error
 
-        if not os.path.exists(pdb_file):
-            raise IOError("PDB File " + str(pdb_file) + "does not exist. ")
 
-        # determine distance matrix from PDB file
-        distance_matrix = ccmpred.io.pdb.distance_map(pdb_file, L=L)
+def _evaluate_protein_task(benchmark, pdb_file, ranks, configurations):
 
-        # get residue pairs that are resolved (not NAN)
-        index_i, index_j = np.where(~np.isnan(distance_matrix))
+    # runs in a worker process: return the profile records together with the results
+    protein_eval_metrics, messages = benchmark.evaluate_protein(pdb_file, ranks, configurations)
 
-        # Create the evaluation file
-        eval_df = pd.DataFrame(
-            {
-                'i': index_i,
-                'j': index_j,
-                'cb_distance': distance_matrix[index_i, index_j],
-            }
-        )
-        eval_df.sort_values(by=['i', 'j'], inplace=True)
+    return protein_eval_metrics, messages, benchmark.profiler.records, benchmark.profiler.counters
+
+
+def select_ranked_pairs(ranked_pairs, mask):
+    """
+    Restrict residue pairs ranked for every method to a subset of pairs, keeping the ranking
+
+    :param ranked_pairs: indices of residue pairs sorted by decreasing score (pairs x methods)
+    :param mask: boolean vector of residue pairs that are kept (pairs)
+    :return: indices of selected residue pairs sorted by decreasing score (selected pairs x methods)
+    """
+
+    ranked_pairs = ranked_pairs.T
+    selected = ranked_pairs[mask[ranked_pairs]]
+
+    return selected.reshape(ranked_pairs.shape[0], -1).T
+
+
+class MatrixCache():
+    """
+    Least recently used cache for contact matrices and their meta data
+
+    Every matrix file is parsed only once. When the matrices held in memory
+    exceed max_bytes, the least recently used matrices are evicted.
+    Meta data is small and is kept for all files that have been read.
+    The cache can be shared by threads: files are parsed outside of the lock.
+    """
+
+    def __init__(self, max_bytes=1024 * 1024**2):
+        self.max_bytes = max_bytes
+        self.matrices = OrderedDict()
+        self.meta = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
 
-        #do not count residue pairs twice
-        eval_df = eval_df[eval_df['j'] > eval_df['i']]
+    def __evict(self):
 
-        return eval_df
+        # always keep the most recently read matrix
+        while self.nbytes > self.max_bytes and len(self.matrices) > 1:
+            _, mat = self.matrices.popitem(last=False)
+            self.nbytes -= mat.nbytes
 
-    def __compute_precision_recall(self, true_class, score):
+    def get(self, mat_file):
         """
-        Compute Precision and Recall for a running threshold
+        Get contact matrix and meta data, parsing the file only if it is not cached
 
-        :param true_class: binary vector
-        :param score: score that is used for ranking
-        :return:
+        :param mat_file: path to contact matrix file
+        :return: matrix, meta data
         """
 
-        df = pd.DataFrame({'true':true_class, 'score':score})
-        df.sort_values('score', ascending=False, inplace=True)
+        with self.lock:
+            if mat_file in self.matrices:
+                self.hits += 1
+                self.matrices.move_to_end(mat_file)
+                return self.matrices[mat_file], self.meta[mat_file]
+            self.misses += 1
 
-        df['cumsum_pred']   = range(1, len(df)+1)
-        df['cumsum_tp']     = df.true.cumsum()
+        mat, meta = matrix_io.read_matrix(mat_file)
 
+        with self.lock:
+            # another thread may have read the same file meanwhile
+            if mat_file not in self.matrices:
+                self.matrices[mat_file] = mat
+                self.nbytes += mat.nbytes
+            self.meta[mat_file] = meta
+            self.__evict()
 
-        df['precision'] = df['cumsum_tp']  / df['cumsum_pred']
-        df['recall']    = df['cumsum_tp']  / np.sum(true_class)
+        return mat, meta
 
-        return df.precision.tolist(), df.recall.tolist(), df.score.tolist()
+    def get_meta(self, mat_file):
+        """
+        Get meta data of a contact matrix file without parsing the matrix
 
-    def __compute_mean_error(self,cb_distance, score, contact_thr):
+        :param mat_file: path to contact matrix file
+        :return: meta data
         """
-            Compute mean error of predictions:
 
-            error:  0, iff cb_distance <= contact_thr
-            d, d=cb_distance - contact_thr
+        with self.lock:
+            if mat_file in self.meta:
+                return self.meta[mat_file]
+
+        meta = matrix_io.read_matrix_meta(mat_file)
+        with self.lock:
+            self.meta[mat_file] = meta
+
+        return meta
+
+    def prefetch_meta(self, mat_files, num_threads=8):
+        """
+        Read meta data of many contact matrix files in parallel threads
 
-        :param cb_distance:
-        :param score:
-        :param contact_thr:
+        :param mat_files: list of paths to contact matrix files
+        :param num_threads: number of threads
         :return:
         """
 
-        df = pd.DataFrame({'cb_distance':cb_distance, 'score':score})
-        df.sort_values('score', ascending=False, inplace=True)
+        with self.lock:
+            mat_files = [mat_file for mat_file in mat_files if mat_file not in self.meta]
+        meta = matrix_io.read_matrix_meta_batch(mat_files, num_threads=num_threads)
+        with self.lock:
+            self.meta.update(meta)
 
-        #compute the error
-        df.loc[:,'error'] = df.cb_distance - contact_thr
-        df.loc[df.error < 0 ,'error'] = 0
+    def clear(self):
+        with self.lock:
+            self.matrices.clear()
+            self.meta.clear()
+            self.nbytes = 0
 
-        df.loc[:,'mean_error'] = df.error.expanding(1).mean()
+    def __getstate__(self):
+        # do not send cached matrices to worker processes
+        return {'max_bytes': self.max_bytes}
 
-        return df.mean_error.tolist()
+    def __setstate__(self, state):
+        self.__init__(max_bytes=state['max_bytes'])
 
-    def __compute_evaluation_statistics_protein(self, pdb_file, ranks, seqsep, contact_thr, noncontact_thr, meta):
 
-        protein = os.path.basename(pdb_file).split(".")[0]
+class Benchmark():
+    """
+    Benchmarking contact prediction methods on a dataset
+    """
 
-        # compute distance matrix from PDB file
-        eval_df = self.__get_distances(pdb_file, meta['L'])
+    def __init__(self, pdb_dir=None, cache_size_mb=1024, distance_cache_dir=None, results_cache_dir=None,
+                 results_cache_content_hash=False, dataset=None, profile=False):
 
-        # remove pairs that are separated less than SEQSEP positions along primary sequence
-        eval_df['class'] = (eval_df['cb_distance'] <= contact_thr) * 1
-        eval_df = eval_df[eval_df['j'] >= (eval_df['i'] + seqsep)]
+        # protein structures and residue pair data can be shared by several Benchmark objects
+        # (without PDB files, a benchmark can only plot evaluation statistics loaded from a file)
+        if dataset is None and pdb_dir is not None:
+            dataset = EvaluationDataset(pdb_dir, distance_cache_dir=distance_cache_dir)
+        self.dataset = dataset
+        self.pdb_dir = self.dataset.pdb_dir if dataset is not None else None
+        self.pdb_files = self.dataset.pdb_files if dataset is not None else []
 
-        # in case noncontact_thr != contact_thr: remove residue pairs with contact_thr < Cb distance < noncontact_thr
-        if noncontact_thr > contact_thr:
-            eval_df = eval_df[(eval_df['cb_distance'] <= contact_thr) | (eval_df['cb_distance'] > noncontact_thr)]
+        self.evaluation_data = {}
+        self.ordered_methods = []
+        self.min_seqsep = {}
+        self.evaluation_statistics = {}
+        self.sweep_statistics = OrderedDict()
+        self.filter = []
 
-        #sort residue pairs
-        eval_df.sort_values(by=['i', 'j'], inplace=True)
-        eval_df.reset_index(inplace=True, drop=True)
+        # every contact matrix is parsed once and shared by filters, meta data lookup and scoring
+        self.matrix_cache = MatrixCache(max_bytes=cache_size_mb * 1024**2)
 
-        # add scores from all methods
-        for method_name in self.ordered_methods:
-            mat, _ = ccmpred.io.contactmatrix.read_matrix(self.evaluation_data[method_name][protein])
-            eval_df[method_name] = mat[eval_df['i'], eval_df['j']]
+        # evaluation metrics are only recomputed for new or modified input files
+        self.results_cache = None
+        if results_cache_dir is not None:
+            self.results_cache = ResultsCache(results_cache_dir, content_hash=results_cache_content_hash)
+
+        # opt-in timers and counters per stage, protein and method
+        self.profiler = Profiler(enabled=profile)
+
+    def __read_matrix(self, method_name, protein):
+        with self.profiler.timer("read_matrix", protein, method_name):
+            return self.matrix_cache.get(self.evaluation_data[method_name][protein])
+
+    def __read_meta(self, method_name, protein):
+        with self.profiler.timer("read_meta", protein, method_name):
+            return self.matrix_cache.get_meta(self.evaluation_data[method_name][protein])
 
-        # determine number of top ranked residue pairs that will be considered for evaluation
-        ranks_L = np.round(meta['L'] * ranks).astype(int)
-        # if there are less residue pairs than max(rank_L): adjust rank_L
-        ranks_L = np.array([rank for rank in ranks_L if rank < len(eval_df)])
+    def __apply_filter(self, protein, messages):
 
+        filter_operators = {
+            'greater': np.greater,
+            'less': np.less,
+            'greater_equal': np.greater_equal,
+            'less_equal': np.less_equal,
+            'equal': np.equal,
+            'not_equal': np.not_equal
+        }
 
-        # compute precision and recall values for all methods
-        protein_eval_metrics={}
         for method_name in self.ordered_methods:
 
-            precision, recall, threshold = self.__compute_precision_recall(
-                eval_df['class'], eval_df[method_name])
-            mean_error = self.__compute_mean_error(eval_df['cb_distance'], eval_df[method_name], contact_thr)
+            meta = self.__read_meta(method_name, protein)
 
-            protein_eval_metrics[method_name] = {}
-            protein_eval_metrics[method_name]['precision'] = [np.array(precision)[rank] for rank in ranks_L]
-            protein_eval_metrics[method_name]['mean_error'] = [np.array(mean_error)[rank] for rank in ranks_L]
-            protein_eval_metrics[method_name]['recall'] = [np.array(recall)[rank] for rank in ranks_L]
+            for f in self.filter:
+                filter_res = ccmpred.io.contactmatrix.find_dict_key(f['key'], meta)
+                if not filter_operators[f['operator']](filter_res, f['value']):
+                    messages.append("{0} did not pass filter for {1} {2} {3}: {4}".format(method_name, f['key'], f['operator'], f['value'], filter_res))
+                    return False
 
-        return protein_eval_metrics
+        return True
+
+    def __compute_evaluation_statistics_protein(self, pdb_file, ranks, configurations, meta, messages):
+        """
+        Compute evaluation metrics for all methods and configurations on a single protein
+
+        Distances and scores are loaded once and residue pairs are ranked once per method.
+        Every configuration (seqsep, contact_thr, noncontact_thr) then selects its residue pairs
+        from this shared ranking. Pairs without score (NAN, e.g. not stored in a sparse top-N file)
+        are not evaluated: metrics at ranks beyond the number of scored pairs are NAN.
+
+        :return: dictionary mapping configurations to evaluation metrics per method
+        """
+
+        protein = os.path.basename(pdb_file).split(".")[0]
+
+        # reuse evaluation metrics of methods whose input files did not change
+        protein_eval_metrics = {configuration: {} for configuration in configurations}
+        if self.results_cache is not None:
+            mat_files = {method_name: self.evaluation_data[method_name][protein] for method_name in self.ordered_methods}
+            settings = {}
+            for configuration in configurations:
+                seqsep, contact_thr, noncontact_thr = configuration
+                settings[configuration] = {
+                    'L': int(meta['L']),
+                    'ranks': np.round(ranks, decimals=6).tolist(),
+                    'seqsep': seqsep,
+                    'contact_thr': contact_thr,
+                    'noncontact_thr': noncontact_thr
+                }
+                with self.profiler.timer("results_cache", protein):
+                    protein_eval_metrics[configuration] = self.results_cache.lookup(
+                        protein, pdb_file, mat_files, settings[configuration])
+
+        methods = [method_name for method_name in self.ordered_methods
+                   if any(method_name not in protein_eval_metrics[configuration] for configuration in configurations)]
+        if len(methods) == 0:
+            return protein_eval_metrics
+
+        # resolved residue pairs from the PDB file (shared with other Benchmark objects on the same data set)
+        with self.profiler.timer("distance_map", protein):
+            pairs = self.dataset.get_pairs(pdb_file, meta['L'])
+        cb_distance = pairs.cb_distance
+        self.profiler.count("residue_pairs", len(pairs))
+
+        # add scores from all methods that need to be evaluated (aligned with the packed residue pairs)
+        scores = np.zeros((len(pairs), len(methods)), dtype=np.float32)
+        for nr, method_name in enumerate(methods):
+            mat, _ = self.__read_matrix(method_name, protein)
+            scores[:, nr] = pairs.gather(mat)
+
+        # rank all residue pairs once per method if there are several configurations
+        ranked_pairs = None
+        if len(configurations) > 1:
+            with self.profiler.timer("ranking", protein):
+                ranked_pairs = rank_pairs(scores)
+
+        for configuration in configurations:
+            seqsep, contact_thr, noncontact_thr = configuration
+
+            config_methods = [method_name for method_name in methods
+                              if method_name not in protein_eval_metrics[configuration]]
+            if len(config_methods) == 0:
+                continue
+            columns = [methods.index(method_name) for method_name in config_methods]
+
+            # residue pairs evaluated for this configuration (seqsep and noncontact_thr)
+            with self.profiler.timer("pair_mask", protein):
+                mask = self.dataset.get_pair_mask(pdb_file, meta['L'], seqsep, contact_thr, noncontact_thr)
+
+            true_class = pairs.true_class(contact_thr)
+            nr_pairs = np.sum(mask)
+
+            # determine number of top ranked residue pairs that will be considered for evaluation
+            ranks_L = np.round(meta['L'] * ranks).astype(int)
+            # if there are less residue pairs than max(rank_L): adjust rank_L
+            ranks_L = np.array([rank for rank in ranks_L if rank < nr_pairs], dtype=int)
+            top = int(np.max(ranks_L)) + 1 if len(ranks_L) > 0 else 0
+
+            # compute precision, recall and mean error values for all methods
+            with self.profiler.timer("ranking", protein):
+                if ranked_pairs is None:
+                    precision, recall, mean_error = compute_metrics_at_ranks(
+                        true_class[mask], cb_distance[mask], rank_pairs(scores[mask][:, columns], top),
+                        ranks_L, contact_thr, np.sum(true_class[mask]))
+                else:
+                    top_pairs = select_ranked_pairs(ranked_pairs[:, columns], mask)[:top]
+                    precision, recall, mean_error = compute_metrics_at_ranks(
+                        true_class, cb_distance, top_pairs, ranks_L, contact_thr, np.sum(true_class[mask]))
+
+                # ranks that need more residue pairs than have a score are not evaluated
+                nr_scored = np.sum(np.isfinite(scores[mask][:, columns]), axis=0)
+                unscored = ranks_L[:, np.newaxis] >= nr_scored[np.newaxis, :]
+                precision[unscored] = np.nan
+                recall[unscored] = np.nan
+                mean_error[unscored] = np.nan
+
+            for nr, method_name in enumerate(config_methods):
+                if np.any(unscored[:, nr]):
+                    messages.append(
+                        "Method {0} has scores for only {1} of {2} residue pairs of protein {3} (seqsep {4}): "
+                        "precision, recall and mean error at ranks > {1} are not evaluated".format(
+                            method_name, nr_scored[nr], nr_pairs, protein, seqsep))
+
+            computed_metrics = {}
+            for nr, method_name in enumerate(config_methods):
+                computed_metrics[method_name] = {}
+                computed_metrics[method_name]['precision'] = precision[:, nr].tolist()
+                computed_metrics[method_name]['mean_error'] = mean_error[:, nr].tolist()
+                computed_metrics[method_name]['recall'] = recall[:, nr].tolist()
+
+            if self.results_cache is not None:
+                with self.profiler.timer("results_cache", protein):
+                    self.results_cache.store(protein, pdb_file, mat_files, settings[configuration], computed_metrics)
+
+            protein_eval_metrics[configuration].update(computed_metrics)
+
+        return {
+            configuration: {method_name: metrics[method_name] for method_name in self.ordered_methods}
+            for configuration, metrics in protein_eval_metrics.items()
+        }
 
     def __compute_meanprecision_per_rank(self):
 
@@ -175,7 +394,8 @@ class Benchmark():
 
         return mean_precision_per_rank
 
-    def __plot_precision_vs_rank_plotly(self, mean_precision_per_rank, title, yaxistitle, legend_order=None, plot_file=None):
+    def __plot_precision_vs_rank_plotly(self, mean_precision_per_rank, title, yaxistitle, legend_order=None, plot_file=None,
+                                        confidence_bands=None):
 
         # define order of methods in the legend
         methods = legend_order
@@ -191,13 +411,43 @@ class Benchmark():
             method_colors = np.array(cl.to_rgb(cl.interp(cl.scales['9']['qual']['Set1'], 50)))
 
 
+        x = [str(rank) for rank in np.round(mean_precision_per_rank['ranks'], decimals=2)]
+
+        # shaded confidence bands are drawn below the lines of all methods
         data = []
+        if confidence_bands is not None:
+            for nr, method in enumerate(methods):
+                fill_color = method_colors[nr].replace("rgb(", "rgba(").replace(")", ",0.2)")
+                data.append(go.Scatter(
+                    x=x,
+                    y=confidence_bands['lower'][method],
+                    name=method + " lower bound",
+                    legendgroup=method,
+                    showlegend=False,
+                    hoverinfo='skip',
+                    mode='lines',
+                    line=dict(width=0, color=fill_color)
+                ))
+                data.append(go.Scatter(
+                    x=x,
+                    y=confidence_bands['upper'][method],
+                    name=method + " upper bound",
+                    legendgroup=method,
+                    showlegend=False,
+                    hoverinfo='skip',
+                    mode='lines',
+                    fill='tonexty',
+                    fillcolor=fill_color,
+                    line=dict(width=0, color=fill_color)
+                ))
+
         for nr, method in enumerate(methods):
 
             method_trace = go.Scatter(
-                x=[str(rank) for rank in np.round(mean_precision_per_rank['ranks'], decimals=2)],
+                x=x,
                 y=mean_precision_per_rank[method],
                 name=method,
+                legendgroup=method,
                 mode='lines',
                 line=dict(
                     width=4,
@@ -228,25 +478,59 @@ class Benchmark():
             plot["layout"]['margin']['t'] = 10
 
         if plot_file is not None:
-            plotly_plot(plot, filename=plot_file, auto_open=False, show_link=False)
+            with self.profiler.timer("plot"):
+                plotly_plot(plot, filename=plot_file, auto_open=False, show_link=False)
         else:
             return plot
 
-    def add_method(self, method_name, method_dir, filter=""):
+    def add_method(self, method_name, method_dir, filter="", manifest=None):
+        """
+        Add a method with one contact prediction file per protein
+
+        Files can be text contact matrices (*.mat) or sparse top-N files (*.top.npz, see convert_matrices.py).
+        Instead of a directory, method_dir can be the index of a matrix archive (*.archive.json,
+        see convert_matrices.py pack); the filter then selects archived files by name.
+
+        :param method_name: name of the method
+        :param method_dir: directory with contact prediction files or matrix archive
+        :param filter: substring of file names
+        :param manifest: Manifest of the data directory used to find files and their meta data (see manifest.py)
+        :return:
+        """
 
         self.ordered_methods.append(method_name)
 
         self.evaluation_data[method_name] = {}
+        self.min_seqsep[method_name] = 1
+
+        if method_dir.endswith(matrix_io.ARCHIVE_EXTENSION):
+            mat_files = matrix_io.archive_members(method_dir, filter)
+        elif manifest is not None:
+            mat_files = manifest.glob(method_dir + "/*" + filter + "*")
+        else:
+            mat_files = glob.glob(method_dir + "/*" + filter + "*")
 
-        for mat_file in glob.glob(method_dir + "/*" + filter + "*"):
-            protein = os.path.basename(mat_file).split(".")[0]
+        for mat_file in mat_files:
+            protein = os.path.basename(mat_file.split(matrix_io.ARCHIVE_SEPARATOR)[-1]).split(".")[0]
             self.evaluation_data[method_name][protein] = mat_file
 
+            # sparse top-N files do not store residue pairs below their minimal sequence separation
+            self.min_seqsep[method_name] = max(self.min_seqsep[method_name], matrix_io.read_min_seqsep(mat_file))
+
+            # meta data of contact matrices is stored in the manifest (unless the file was modified since)
+            if manifest is not None:
+                entry = manifest.current_entry(mat_file)
+                if entry is not None and entry['meta'] is not None:
+                    self.matrix_cache.meta[mat_file] = entry['meta']
+
     def reset_methods(self):
         self.ordered_methods = []
         self.evaluation_data = {}
+        self.min_seqsep = {}
         self.evaluation_statistics = {}
+        self.sweep_statistics = OrderedDict()
         self.filter = []
+        self.matrix_cache.clear()
 
     def add_constraint(self, key, value, operator):
         self.filter.append(
@@ -255,67 +539,279 @@ class Benchmark():
              "operator": operator}
         )
 
-    def compute_evaluation_statistics(self, seqsep=12, contact_thr=8, noncontact_thr=8):
+    def __pdb_proteins(self):
+        return set(os.path.basename(pdb_file).split(".")[0] for pdb_file in self.pdb_files)
 
-        self.evaluation_statistics = {}
+    def __protein_view(self, pdb_file):
+        """
+        Copy of the benchmark restricted to a single protein that is cheap to send to worker processes
+        """
+
+        protein = os.path.basename(pdb_file).split(".")[0]
 
-        # definition of true positive (residue-residue contact based on distance between Cb atoms)
-        self.evaluation_statistics['contact_thr'] = contact_thr
+        view = copy.copy(self)
+        view.evaluation_data = {
+            method_name: {protein: mat_files[protein]} if protein in mat_files else {}
+            for method_name, mat_files in self.evaluation_data.items()
+        }
+        view.evaluation_statistics = {}
+        view.sweep_statistics = OrderedDict()
+        view.profiler = Profiler(enabled=self.profiler.enabled)
 
-        # definition of true negative (what is NOT a residue-residue contact based on distance between Cb atoms)
-        if noncontact_thr < contact_thr:
-            noncontact_thr = contact_thr
-        self.evaluation_statistics['noncontact_thr'] = noncontact_thr
+        return view
 
-        # ignore residue pairs that are separated by less than SEQSEP positions in the primary sequence
-        self.evaluation_statistics['seqsep'] = seqsep
+    def evaluate_protein(self, pdb_file, ranks, configurations):
+        """
+        Compute evaluation metrics for all methods on a single protein
 
-        # define x-axis: number of top ranked predictions (wrt to protein length) that will be considered for evaluation
-        self.evaluation_statistics['ranks'] =  np.linspace(1, 0, 50, endpoint=False)[::-1]
+        :param pdb_file: path to PDB file of the protein
+        :param ranks: number of top ranked predictions wrt to protein length
+        :param configurations: list of (seqsep, contact_thr, noncontact_thr) tuples
+        :return: evaluation metrics per configuration and method (None if the protein is skipped), list of messages
+        """
 
-        # name of methods for evaluation
-        self.evaluation_statistics['methods'] = self.ordered_methods
+        protein = os.path.basename(pdb_file).split(".")[0]
+        messages = []
+
+        # ensure that all methods are compared on the same data set:
+        # if a protein is not available for one of the methods then this protein is skipped
+        if not all([protein in self.evaluation_data[method_name].keys() for method_name in
+                    self.ordered_methods]):
+            messages.append("No scores available for protein {0} for at least one of the methods".format(protein))
+            return None, messages
+
+        # ensure that special constraints are fulfilled
+        if not (self.__apply_filter(protein, messages)):
+            messages.append("Protein {0} did not pass filters for at least one of the methods.".format(protein))
+            return None, messages
+
+        #get some meta information about the protein from one of the methods meta info
+        meta_protein = {}
+        meta = self.__read_meta(self.ordered_methods[0], protein)
+        meta_protein['L'] = ccmpred.io.contactmatrix.find_dict_key('ncol', meta)
+        meta_protein['N'] = ccmpred.io.contactmatrix.find_dict_key('nrow', meta)
+        meta_protein['Diversity'] = ccmpred.io.contactmatrix.find_dict_key('diversity', meta)
+        meta_protein['neff'] = ccmpred.io.contactmatrix.find_dict_key('neff', meta)
+
+        # compute evaluation metrics: precision, recall, mean error for every method in benchmark_methods
+        with self.profiler.timer("protein", protein):
+            protein_eval_metrics = self.__compute_evaluation_statistics_protein(
+                pdb_file, ranks, configurations, meta_protein, messages)
+
+        return protein_eval_metrics, messages
+
+    def compute_evaluation_statistics_sweep(self, configurations, n_jobs=1, executor=None):
+        """
+        Compute precision, recall and mean error for all methods and proteins for several configurations
+
+        Per protein, distances and scores are loaded once and residue pairs are ranked once per method;
+        all configurations are derived from this shared work.
+        Proteins are evaluated independently. With n_jobs > 1 (or a given concurrent.futures executor)
+        they are distributed over worker processes; results and messages are collected in the
+        order of the PDB files.
+
+        :param configurations: list of (seqsep, contact_thr, noncontact_thr) tuples
+        :param n_jobs: number of worker processes
+        :param executor: concurrent.futures executor used instead of creating a process pool (process or thread
+                         executor: with threads, workers share the locked matrix and residue pair caches)
+        :return: dictionary mapping configurations to evaluation statistics
+        """
 
-        #dictionary collecting the evaluation statistics per protein
-        self.evaluation_statistics['proteins'] = {}
+        if self.dataset is None:
+            raise ValueError("Evaluation statistics can only be computed for a Benchmark with PDB files!")
+
+        # definition of true negative (what is NOT a residue-residue contact based on distance between Cb atoms)
+        configurations = [
+            (seqsep, contact_thr, max(contact_thr, noncontact_thr))
+            for seqsep, contact_thr, noncontact_thr in configurations]
+        configurations = list(OrderedDict.fromkeys(configurations))
+
+        # residue pairs that are not stored in sparse top-N files would be ranked last instead of by their score
+        for seqsep, _, _ in configurations:
+            for method_name in self.ordered_methods:
+                if seqsep < self.min_seqsep[method_name]:
+                    raise ValueError(
+                        "Method {0} only stores residue pairs with a sequence separation of at least {1}: "
+                        "cannot evaluate seqsep {2}".format(method_name, self.min_seqsep[method_name], seqsep))
+
+        # define x-axis: number of top ranked predictions (wrt to protein length) that will be considered for evaluation
+        ranks = np.linspace(1, 0, 50, endpoint=False)[::-1]
+
+        self.sweep_statistics = OrderedDict()
+        for seqsep, contact_thr, noncontact_thr in configurations:
+            self.sweep_statistics[(seqsep, contact_thr, noncontact_thr)] = {
+                # definition of true positive (residue-residue contact based on distance between Cb atoms)
+                'contact_thr': contact_thr,
+                'noncontact_thr': noncontact_thr,
+                # ignore residue pairs that are separated by less than SEQSEP positions in the primary sequence
+                'seqsep': seqsep,
+                'ranks': ranks,
+                # name of methods for evaluation
+                'methods': self.ordered_methods,
+                #dictionary collecting the evaluation statistics per protein
+                'proteins': {}
+            }
 
         print("Compute evaluation statistics for {0} proteins and methods:".format(len(self.pdb_files)))
         print(self.ordered_methods)
 
-        # iterate over proteins with pdb structures
-        for id, pdb_file in enumerate(self.pdb_files):
+        # evaluate proteins in worker processes
+        own_executor = executor is None and n_jobs > 1
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=n_jobs)
+
+        if executor is None:
+            # filters and meta data lookup only need the meta data
+            pdb_proteins = self.__pdb_proteins()
+            self.matrix_cache.prefetch_meta(
+                [mat_files[protein] for mat_files in self.evaluation_data.values() for protein in mat_files
+                 if protein in pdb_proteins])
+            results = (self.evaluate_protein(pdb_file, ranks, configurations) + ([], None)
+                       for pdb_file in self.pdb_files)
+        else:
+            futures = [
+                executor.submit(_evaluate_protein_task, self.__protein_view(pdb_file), pdb_file, ranks, configurations)
+                for pdb_file in self.pdb_files]
+            results = (future.result() for future in futures)
+
+        # collect results in the order of pdb files
+        try:
+            for id, (pdb_file, result) in enumerate(zip(self.pdb_files, results)):
+                protein_eval_metrics, messages, profile_records, profile_counters = result
+
+                protein = os.path.basename(pdb_file).split(".")[0]
+                print(str(id + 1) + "/" + str(len(self.pdb_files)) + " " + str(protein))
+                for message in messages:
+                    print(message)
+                self.profiler.merge(profile_records, profile_counters)
+
+                if protein_eval_metrics is not None:
+                    for configuration, metrics in protein_eval_metrics.items():
+                        self.sweep_statistics[configuration]['proteins'][protein] = metrics
+        finally:
+            if own_executor:
+                executor.shutdown()
+
+        print("There are {0} proteins in the evaluation data set.".format(
+            len(self.sweep_statistics[configurations[0]]['proteins'])))
+        if executor is None:
+            print("Matrix cache: {0} matrices parsed, {1} reads served from cache, meta data of {2} files.".format(
+                self.matrix_cache.misses, self.matrix_cache.hits, len(self.matrix_cache.meta)))
+            self.profiler.count("matrices_parsed", self.matrix_cache.misses)
+            self.profiler.count("matrix_cache_hits", self.matrix_cache.hits)
+        self.profiler.count("proteins_evaluated", len(self.sweep_statistics[configurations[0]]['proteins']))
+        self.profiler.print_summary()
+
+        # plots use the statistics of the first configuration unless another one is selected
+        self.evaluation_statistics = self.sweep_statistics[configurations[0]]
+
+        return self.sweep_statistics
+
+    def select_configuration(self, seqsep, contact_thr, noncontact_thr):
+        """
+        Use the evaluation statistics of one configuration of a sweep for plotting
 
-            protein = os.path.basename(pdb_file).split(".")[0]
-            print(str(id + 1) + "/" + str(len(self.pdb_files)) + " " + str(protein))
+        :param seqsep: minimal sequence separation of residue pairs
+        :param contact_thr: Cb distance threshold defining a contact
+        :param noncontact_thr: Cb distance threshold defining a non-contact
+        :return:
+        """
 
-            # ensure that all methods are compared on the same data set:
-            # if a protein is not available for one of the methods then this protein is skipped
-            if not all([protein in self.evaluation_data[method_name].keys() for method_name in
-                        self.ordered_methods]):
-                print("No scores available for protein {0} for at least one of the methods".format(protein))
-                continue
+        configuration = (seqsep, contact_thr, max(contact_thr, noncontact_thr))
+        if configuration not in self.sweep_statistics:
+            raise KeyError("No evaluation statistics for configuration {0}".format(configuration))
 
-            # ensure that special constraints are fulfilled
-            if not (self.__apply_filter(protein)):
-                print("Protein {0} did not pass filters for at least one of the methods.".format(protein))
-                continue
+        self.evaluation_statistics = self.sweep_statistics[configuration]
+
+    def compute_evaluation_statistics(self, seqsep=12, contact_thr=8, noncontact_thr=8, n_jobs=1, executor=None):
+        """
+        Compute precision, recall and mean error for all methods and proteins
+
+        Proteins are evaluated independently. With n_jobs > 1 (or a given concurrent.futures executor)
+        they are distributed over worker processes; results and messages are collected in the
+        order of the PDB files.
+
+        :param seqsep: minimal sequence separation of residue pairs
+        :param contact_thr: Cb distance threshold defining a contact
+        :param noncontact_thr: Cb distance threshold defining a non-contact
+        :param n_jobs: number of worker processes
+        :param executor: concurrent.futures executor used instead of creating a process pool (process or thread
+                         executor: with threads, workers share the locked matrix and residue pair caches)
+        :return:
+        """
+
+        self.compute_evaluation_statistics_sweep(
+            [(seqsep, contact_thr, noncontact_thr)], n_jobs=n_jobs, executor=executor)
+
+    def write_profile(self, json_file):
+        """
+        Write timings and counters of a profiled run (Benchmark(..., profile=True)) to a JSON file
+
+        :param json_file: path to output file
+        :return:
+        """
+
+        if not self.profiler.enabled:
+            print("Profiling is not enabled for this benchmark!")
+            return
+
+        self.profiler.write_json(json_file)
+
+    def export_evaluation_statistics(self, file_path):
+        """
+        Write evaluation statistics to a columnar file (.parquet or .npz)
+
+        :param file_path: path to output file
+        :return:
+        """
 
-            #get some meta information about the protein from one of the methods meta info
-            meta_protein = {}
-            mat_file = self.evaluation_data[list(self.evaluation_data.keys())[0]][protein]
-            mat, meta = ccmpred.io.contactmatrix.read_matrix(mat_file)
-            meta_protein['L'] = ccmpred.io.contactmatrix.find_dict_key('ncol', meta)
-            meta_protein['N'] = ccmpred.io.contactmatrix.find_dict_key('nrow', meta)
-            meta_protein['Diversity'] = ccmpred.io.contactmatrix.find_dict_key('diversity', meta)
-            meta_protein['neff'] = ccmpred.io.contactmatrix.find_dict_key('neff', meta)
+        if len(self.evaluation_statistics) == 0:
+            print("You first need to calculate statistics for selected methods!")
+            return
+
+        statistics_io.write_evaluation_statistics(self.evaluation_statistics, file_path)
+
+    @classmethod
+    def from_evaluation_statistics(cls, file_path, **kwargs):
+        """
+        Create a Benchmark from evaluation statistics written with export_evaluation_statistics
+
+        The benchmark can be plotted directly; no contact matrix or PDB file is read.
 
-            # compute evaluation metrics: precision, recall, mean error for every method in benchmark_methods
-            self.evaluation_statistics['proteins'][protein] = self.__compute_evaluation_statistics_protein(
-                pdb_file, self.evaluation_statistics['ranks'], seqsep, contact_thr, noncontact_thr, meta_protein)
+        :param file_path: path to .parquet or .npz file
+        :param kwargs: further arguments to the Benchmark constructor
+        :return: Benchmark
+        """
 
-        print("There are {0} proteins in the evaluation data set.".format(len(self.evaluation_statistics['proteins'])))
+        benchmark = cls(**kwargs)
+        benchmark.evaluation_statistics = statistics_io.read_evaluation_statistics(file_path)
+        benchmark.ordered_methods = list(benchmark.evaluation_statistics['methods'])
+        benchmark.evaluation_statistics['methods'] = benchmark.ordered_methods
+        benchmark.evaluation_data = {method_name: {} for method_name in benchmark.ordered_methods}
 
-    def plot_precision_vs_rank(self, plot_file=None):
+        return benchmark
+
+    def compute_confidence_bands(self, nr_resamples=2000, confidence=0.95, seed=0):
+        """
+        Bootstrap confidence bands for the mean precision per rank by resampling proteins
+
+        :param nr_resamples: number of bootstrap resamples
+        :param confidence: confidence level of the intervals
+        :param seed: seed of the random number generator
+        :return: dictionary with 'mean', 'lower' and 'upper' per method and
+                 'difference' per pair of methods (method_a, method_b) with the paired interval of a - b
+        """
+
+        if len(self.evaluation_statistics) == 0:
+            print("You first need to calculate statistics for selected methods!")
+            return
+
+        with self.profiler.timer("bootstrap"):
+            return bootstrap.bootstrap_precision(
+                self.evaluation_statistics, self.ordered_methods,
+                nr_resamples=nr_resamples, confidence=confidence, seed=seed)
+
+    def plot_precision_vs_rank(self, plot_file=None, confidence_bands=False, nr_resamples=2000, confidence=0.95):
 
         if len(self.evaluation_statistics) == 0:
             print("You first need to calculate statistics for selected methods!")
@@ -323,8 +819,13 @@ class Benchmark():
 
         mean_precision_per_rank = self.__compute_meanprecision_per_rank()
 
+        bands = None
+        if confidence_bands:
+            bands = self.compute_confidence_bands(nr_resamples=nr_resamples, confidence=confidence)
+
         title=""
         yaxistitle = 'Mean Precision over Proteins'
 
         return self.__plot_precision_vs_rank_plotly(
-                mean_precision_per_rank, title, yaxistitle, legend_order=self.ordered_methods, plot_file=plot_file)
\ No newline at end of file
+                mean_precision_per_rank, title, yaxistitle, legend_order=self.ordered_methods, plot_file=plot_file,
+                confidence_bands=bands)
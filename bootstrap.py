@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+###     Bootstrap confidence intervals for benchmark statistics
+###     Per-protein precision values are stacked into a
+###     (proteins x methods x ranks) array. Resamples of proteins are drawn
+###     in batches as multinomial counts, so the mean precision of thousands
+###     of resamples is computed with a few matrix products.
+# ===============================================================================
+
+### load libraries
+import itertools
+import numpy as np
+
+
+def stack_metric(evaluation_statistics, methods, metric='precision'):
+    """
+    Stack a metric over proteins, methods and ranks
+
+    :param evaluation_statistics: Benchmark.evaluation_statistics
+    :param methods: list of method names
+    :param metric: 'precision', 'recall' or 'mean_error'
+    :return: array (proteins x methods x ranks), missing ranks are NaN
+    """
+
+    proteins = list(evaluation_statistics['proteins'].keys())
+    nr_ranks = len(evaluation_statistics['ranks'])
+
+    values = np.full((len(proteins), len(methods), nr_ranks), np.nan)
+    for p, protein in enumerate(proteins):
+        for m, method_name in enumerate(methods):
+            protein_values = evaluation_statistics['proteins'][protein][method_name][metric]
+            values[p, m, :len(protein_values)] = protein_values
+
+    return values
+
+
+def bootstrap_means(values, nr_resamples=2000, batch_size=500, seed=0):
+    """
+    Mean over proteins for bootstrap resamples of proteins (ignoring NaN)
+
+    :param values: array (proteins x methods x ranks)
+    :param nr_resamples: number of bootstrap resamples
+    :param batch_size: number of resamples drawn at once
+    :param seed: seed of the random number generator
+    :return: array (resamples x methods x ranks)
+    """
+
+    rng = np.random.RandomState(seed)
+    nr_proteins = values.shape[0]
+
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+
+    means = np.zeros((nr_resamples,) + values.shape[1:])
+    for start in range(0, nr_resamples, batch_size):
+        size = min(batch_size, nr_resamples - start)
+
+        # how often each protein is drawn in each resample
+        counts = rng.multinomial(nr_proteins, np.ones(nr_proteins) / nr_proteins, size=size).astype(np.float64)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means[start:start + size] = (
+                np.einsum('bp,pmr->bmr', counts, filled) / np.einsum('bp,pmr->bmr', counts, valid))
+
+    return means
+
+
+def bootstrap_precision(evaluation_statistics, methods, nr_resamples=2000, confidence=0.95, seed=0):
+    """
+    Bootstrap confidence bands for the mean precision per rank and paired differences between methods
+
+    Proteins are resampled with replacement; all methods are evaluated on the same resamples,
+    so the intervals of differences account for the pairing of methods on proteins.
+
+    :param evaluation_statistics: Benchmark.evaluation_statistics
+    :param methods: list of method names
+    :param nr_resamples: number of bootstrap resamples
+    :param confidence: confidence level of the intervals
+    :param seed: seed of the random number generator
+    :return: dictionary with 'mean', 'lower' and 'upper' per method and
+             'difference' per pair of methods (method_a, method_b) with mean, lower and upper of a - b
+    """
+
+    precision = stack_metric(evaluation_statistics, methods, 'precision')
+    means = bootstrap_means(precision, nr_resamples=nr_resamples, seed=seed)
+
+    alpha = (1 - confidence) / 2 * 100
+    mean = np.nanmean(precision, axis=0)
+    lower, upper = np.nanpercentile(means, [alpha, 100 - alpha], axis=0)
+
+    bootstrap = {
+        'ranks': evaluation_statistics['ranks'],
+        'mean': {method_name: mean[m] for m, method_name in enumerate(methods)},
+        'lower': {method_name: lower[m] for m, method_name in enumerate(methods)},
+        'upper': {method_name: upper[m] for m, method_name in enumerate(methods)},
+        'difference': {}
+    }
+
+    for (a, method_a), (b, method_b) in itertools.permutations(enumerate(methods), 2):
+        difference = means[:, a] - means[:, b]
+        lower, upper = np.nanpercentile(difference, [alpha, 100 - alpha], axis=0)
+        bootstrap['difference'][(method_a, method_b)] = {
+            'mean': mean[a] - mean[b],
+            'lower': lower,
+            'upper': upper
+        }
+
+    return bootstrap
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+###     Convert contact predictions into compact formats read by Benchmark
+###     - sparse: keep only the top N residue pairs of every contact matrix
+###               (from *.mat files or from binary raw files *.braw.gz)
+###     - binary: write memory-mappable float32 copies of *.mat files that are
+###               read instead of the text files while they are up to date
+###     - pack:   consolidate all contact matrices of a method directory into
+###               one indexed archive
+# ===============================================================================
+
+### load libraries
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import ccmpred.io.contactmatrix
+import ccmpred.raw
+import correction_terms
+import matrix_io
+
+
+def read_contact_matrix(input_file, score="apc"):
+    """
+    Read a contact matrix from a text matrix file or compute it from a binary raw file
+
+    :param input_file: path to *.mat or *.braw.gz file
+    :param score: score computed from binary raw files: "frobenius" or "apc"
+    :return: L x L contact matrix, meta data
+    """
+
+    if not input_file.endswith(".braw.gz"):
+        return ccmpred.io.contactmatrix.read_matrix(input_file)
+
+    # potentials are centered as for the APC corrected predictions (correction_terms.py)
+    braw = ccmpred.raw.parse_msgpack(input_file)
+    _, x_pair = correction_terms.recenter_potentials(braw.x_single, braw.x_pair)
+    mat = ccmpred.io.contactmatrix.frobenius_score(x_pair)
+    if score == "apc":
+        mat = mat - correction_terms.apc_correction(mat)
+
+    return mat, braw.meta
+
+
+def output_name(input_file, score="apc"):
+
+    name = os.path.basename(input_file)
+    if name.endswith(".braw.gz"):
+        return name[:-len(".braw.gz")] + "." + score
+    if name.endswith(".mat"):
+        return name[:-len(".mat")]
+    return name
+
+
+def convert_sparse(input_file, output_dir, top_factor, min_seqsep, score="apc"):
+
+    mat, meta = read_contact_matrix(input_file, score=score)
+    top = int(np.ceil(top_factor * mat.shape[0]))
+
+    sparse_file = os.path.join(output_dir, output_name(input_file, score) + matrix_io.SPARSE_EXTENSION)
+    matrix_io.write_sparse_matrix(sparse_file, mat, meta, top, min_seqsep=min_seqsep)
+
+    return sparse_file
+
+
+def convert_binary(mat_file, force=False):
+
+    if not force and matrix_io.current_binary_matrix_files(mat_file) is not None:
+        return mat_file
+
+    mat, meta = ccmpred.io.contactmatrix.read_matrix(mat_file)
+    matrix_io.write_binary_matrix(mat_file, mat, meta)
+
+    return mat_file
+
+
+def read_named_matrix(mat_file):
+    mat, meta = matrix_io.read_matrix(mat_file)
+    return os.path.basename(mat_file), np.asarray(mat), meta, matrix_io.read_min_seqsep(mat_file)
+
+
+def read_matrices(input_files, num_processes=1):
+
+    # matrices are parsed in parallel and written to the archive in order
+    with ProcessPoolExecutor(max_workers=num_processes) as executor:
+        matrices = executor.map(read_named_matrix, input_files)
+        for id, (name, mat, meta, min_seqsep) in enumerate(matrices):
+            print(str(id + 1) + "/" + str(len(input_files)) + " " + name)
+            yield name, mat, meta, min_seqsep
+
+
+def parse_args():
+    """
+    parse command line arguments
+    :return:
+    """
+
+    parser = argparse.ArgumentParser(description='Convert contact predictions into compact formats.')
+    subparsers = parser.add_subparsers(dest="format")
+
+    sparse = subparsers.add_parser("sparse", help="keep the top N residue pairs of every contact matrix")
+    sparse.add_argument("input_dir", type=str, help="directory with *.mat or *.braw.gz files")
+    sparse.add_argument("output_dir", type=str, help="directory for *.top.npz files")
+    sparse.add_argument("--filter", type=str, default="", help="substring of input file names, as in Benchmark.add_method")
+    sparse.add_argument("--top-factor", type=float, default=5,
+                        help="keep top-factor x L residue pairs (must cover the largest rank after "
+                             "removing pairs by sequence separation and unresolved pairs)")
+    sparse.add_argument("--min-seqsep", type=int, default=6,
+                        help="minimal sequence separation of residue pairs that are kept (stored in the file; "
+                             "use the smallest seqsep of the benchmark so the top N pairs are all evaluated)")
+    sparse.add_argument("--score", type=str, default="apc", choices=["frobenius", "apc"],
+                        help="score computed from binary raw files")
+    sparse.add_argument("--num-processes", type=int, default=1, help="number of parallel processes")
+
+    binary = subparsers.add_parser("binary", help="write binary copies of text contact matrices to INPUT_DIR/.binary/")
+    binary.add_argument("input_dir", type=str, help="directory with *.mat files")
+    binary.add_argument("--filter", type=str, default="", help="substring of input file names, as in Benchmark.add_method")
+    binary.add_argument("--force", action="store_true", default=False, help="also convert files with an up to date binary copy")
+    binary.add_argument("--num-processes", type=int, default=1, help="number of parallel processes")
+
+    archive = subparsers.add_parser("pack", help="consolidate all contact matrices of a directory into one archive")
+    archive.add_argument("input_dir", type=str, help="directory with *.mat or *.top.npz files")
+    archive.add_argument("archive", type=str,
+                         help="path to archive without extension (writes ARCHIVE.archive.json and ARCHIVE.archive.npy)")
+    archive.add_argument("--filter", type=str, default="", help="substring of input file names")
+    archive.add_argument("--num-processes", type=int, default=1, help="number of parallel processes")
+
+    args = parser.parse_args()
+    if args.format is None:
+        parser.error("specify the output format")
+
+    return args
+
+def main():
+
+    #parse command line arguments
+    args = parse_args()
+
+    if args.format == "pack":
+        input_files = sorted(input_file for input_file in glob.glob(args.input_dir + "/*" + args.filter + "*")
+                             if input_file.endswith(".mat") or input_file.endswith(matrix_io.SPARSE_EXTENSION))
+        print("Pack {0} files from {1} into {2}...".format(len(input_files), args.input_dir, args.archive))
+        archive_dir = os.path.dirname(os.path.abspath(args.archive))
+        if not os.path.exists(archive_dir):
+            os.makedirs(archive_dir)
+        matrix_io.write_archive(args.archive, read_matrices(input_files, args.num_processes))
+        return
+
+    if args.format == "binary":
+        input_files = [input_file for input_file in glob.glob(args.input_dir + "/*" + args.filter + "*")
+                       if input_file.endswith(".mat")]
+        print("Write binary copies of {0} files in {1}...".format(len(input_files), args.input_dir))
+        jobs = [(convert_binary, input_file, args.force) for input_file in input_files]
+    else:
+        if not os.path.exists(args.output_dir):
+            os.makedirs(args.output_dir)
+        input_files = [input_file for input_file in glob.glob(args.input_dir + "/*" + args.filter + "*")
+                       if input_file.endswith(".mat") or input_file.endswith(".braw.gz")]
+        print("Convert {0} files from {1} to {2}...".format(len(input_files), args.input_dir, args.output_dir))
+        jobs = [(convert_sparse, input_file, args.output_dir, args.top_factor, args.min_seqsep, args.score)
+                for input_file in input_files]
+
+    with ProcessPoolExecutor(max_workers=args.num_processes) as executor:
+        futures = [executor.submit(*job) for job in jobs]
+        for id, future in enumerate(futures):
+            print(str(id + 1) + "/" + str(len(jobs)) + " " + os.path.basename(future.result()))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+###     APC and entropy correction terms of MRF models
+###     The alignment is read and filtered, and sequence weights and amino
+###     acid frequencies are computed only once per protein. The correction
+###     terms of all MRF models learned on this alignment (e.g. with
+###     pseudo-likelihood and persistent contrastive divergence) are then
+###     computed from their binary raw files. recenter_potentials and
+###     apc_correction are shared with convert_matrices.py.
+# ===============================================================================
+
+### load libraries
+import numpy as np
+from ccmpred import CCMpred
+from ccmpred import sanity_check
+from ccmpred.io import contactmatrix
+
+
+def recenter_potentials(x_single, x_pair):
+    """
+    Center single and pair potentials at zero, as CCMpred.recenter_potentials
+
+    Centering is a no-op for potentials that already sum to zero.
+
+    :param x_single: L x 21 single potentials
+    :param x_pair: L x L x 21 x 21 pair potentials
+    :return: centered single and pair potentials
+    """
+
+    return sanity_check.centering_potentials(x_single, x_pair)
+
+
+def apc_correction(cmat):
+    """
+    Average product correction term of a contact matrix
+
+    :param cmat: L x L contact matrix (e.g. Frobenius scores)
+    :return: L x L APC correction
+    """
+
+    mean = np.mean(cmat, axis=0)
+    return mean[:, np.newaxis] * mean[np.newaxis, :] / np.mean(cmat)
+
+
+class CorrectionTerms():
+    """
+    Correction terms of several MRF models (binary raw files) learned on the same alignment
+    """
+
+    def __init__(self, alignment_file):
+
+        #initialise ccmpred object
+        self.ccm = CCMpred()
+        self.ccm.set_alignment_file(alignment_file)
+
+        # read alignment and remove gapped sequences and positions
+        self.ccm.read_alignment("psicov", 50, 75)
+
+        # compute sequence weights (in order to reduce sampling bias)
+        self.ccm.compute_sequence_weights("simple", 0.8)
+
+        # compute amino acid counts and frequencies adding pseudo counts for non-observed amino acids
+        self.ccm.compute_frequencies("uniform_pseudocounts", 1,  1)
+
+    def compute(self, binary_raw_file):
+        """
+        APC and entropy correction terms of the MRF model in a binary raw file
+
+        :param binary_raw_file: path to binary raw file (*.braw.gz)
+        :return: L x L APC correction, L x L entropy correction
+        """
+
+        #read in binary raw file
+        self.ccm.set_initraw_file(binary_raw_file)
+        self.ccm.intialise_potentials()
+
+        #compute apc
+        self.ccm.recenter_potentials()
+        cmat = contactmatrix.frobenius_score(self.ccm.x_pair)
+        apc_mat = apc_correction(cmat)
+
+        #compute entropy correction
+        single_freq = self.ccm.pseudocounts.freqs[0]
+        nr_states = 20
+        log = np.log2
+        scaling_factor, mat_corrected = contactmatrix.compute_local_correction(
+            single_freq, self.ccm.x_pair, self.ccm.neff, 1,
+            squared=False, entropy=True, nr_states=nr_states, log=log
+        )
+        entropy_correction_mat = cmat - mat_corrected
+
+        return apc_mat, entropy_correction_mat
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+###     Correlation statistics between two score vectors
+###     Pearson's r, Spearman's rho and the linear regression share the
+###     centered vectors and sums of squares. The rankings are not shared
+###     between statistics: Spearman's rho ranks both vectors once, Kendall's
+###     tau and the two-sample Kolmogorov-Smirnov test are left to
+###     scipy.stats, which sorts the vectors again (faster than a shared
+###     numpy ranking for these two). Results match scipy.stats (pearsonr,
+###     spearmanr, kendalltau, ks_2samp and linregress) up to floating point
+###     accuracy.
+###     RunningPearson computes Pearson's r of vectors that are too large to be
+###     held in memory from blocks of values.
+# ===============================================================================
+
+### load libraries
+import numpy as np
+from scipy import stats
+
+
+def _pearson(x, y):
+
+    # correlation coefficient with the two-sided p-value of the t-test (as scipy.stats.pearsonr)
+    size = len(x)
+    x_centered = x - np.mean(x)
+    y_centered = y - np.mean(y)
+    sxx = np.dot(x_centered, x_centered)
+    syy = np.dot(y_centered, y_centered)
+    r = min(1.0, max(-1.0, np.dot(x_centered, y_centered) / np.sqrt(sxx * syy)))
+
+    pvalue = 2 * stats.t.sf(np.abs(r) * np.sqrt((size - 2) / max((1.0 - r) * (1.0 + r), 1e-300)), size - 2)
+
+    return r, pvalue, sxx, syy
+
+
+class RunningPearson():
+    """
+    Pearson correlation coefficient accumulated over blocks of paired values
+
+    Every block contributes its size, means, sums of squares and cross-products (centered on the
+    block means) which are merged into the running statistics (Chan et al.), so the result does not
+    suffer from cancellation in sum(x*x) - n*mean(x)^2 and memory is bounded by the block size.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.sxx = 0.0
+        self.syy = 0.0
+        self.sxy = 0.0
+
+    def update(self, x, y):
+        """
+        Add a block of paired values
+
+        :param x: block of x values
+        :param y: block of y values (same shape as x)
+        """
+
+        x = np.asarray(x, dtype=np.float64).ravel()
+        y = np.asarray(y, dtype=np.float64).ravel()
+        n_block = len(x)
+        if n_block == 0:
+            return
+
+        mean_x = np.mean(x)
+        mean_y = np.mean(y)
+        x_centered = x - mean_x
+        y_centered = y - mean_y
+
+        n = self.n + n_block
+        delta_x = mean_x - self.mean_x
+        delta_y = mean_y - self.mean_y
+        weight = self.n * n_block / float(n)
+
+        self.sxx += np.dot(x_centered, x_centered) + delta_x * delta_x * weight
+        self.syy += np.dot(y_centered, y_centered) + delta_y * delta_y * weight
+        self.sxy += np.dot(x_centered, y_centered) + delta_x * delta_y * weight
+        self.mean_x += delta_x * n_block / float(n)
+        self.mean_y += delta_y * n_block / float(n)
+        self.n = n
+
+    def correlation(self):
+        """
+        Pearson's r of all values added so far (as np.corrcoef(x, y)[0, 1])
+        """
+
+        if self.n < 2 or self.sxx == 0 or self.syy == 0:
+            return np.nan
+
+        return min(1.0, max(-1.0, self.sxy / np.sqrt(self.sxx * self.syy)))
+
+
+def correlation_statistics(x, y):
+    """
+    Correlation statistics between two score vectors
+
+    :param x: vector of scores
+    :param y: vector of scores
+    :return: dictionary with pearson (r, pvalue), spearmanrho (rho, pvalue), kendalltau (tau, pvalue),
+             kolmogorov-smirnov (statistic, pvalue) and linreg (slope, intercept, rvalue, pvalue, stderr) of y on x
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    size = len(x)
+
+    # Spearman's rho is Pearson's r of the average ranks
+    r, pvalue, sxx, syy = _pearson(x, y)
+    rho, rho_pvalue, _, _ = _pearson(stats.rankdata(x), stats.rankdata(y))
+
+    slope = r * np.sqrt(syy / sxx)
+    intercept = np.mean(y) - slope * np.mean(x)
+    stderr = np.sqrt((1 - r**2) * syy / sxx / (size - 2))
+
+    return {
+        "pearson": (r, pvalue),
+        "kolmogorov-smirnov": tuple(stats.ks_2samp(x, y))[:2],
+        "spearmanrho": (rho, rho_pvalue),
+        "kendalltau": tuple(stats.kendalltau(x, y))[:2],
+        "linreg": (slope, intercept, r, pvalue, stderr)
+    }
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+###     Evaluation data set for contact prediction benchmarks
+###     Everything that depends only on the protein structures (PDB files,
+###     distance maps, resolved residue pairs, pair masks) is computed once
+###     and shared by all Benchmark objects attached to the data set.
+###     Residue pairs are stored as a packed upper triangle (j > i) with
+###     compact index and float32 values instead of a data frame.
+# ===============================================================================
+
+### load libraries
+from collections import OrderedDict
+from functools import lru_cache
+import glob
+import threading
+import numpy as np
+from distance_cache import DistanceMapCache, default_cache_dir
+
+
+@lru_cache(maxsize=8)
+def upper_triangle_index(L):
+    """
+    Residue indices i and j of all pairs j > i of a protein of length L, sorted by i and j
+
+    The index is shared by all proteins of the same length and must not be modified.
+
+    :param L: protein length
+    :return: index vectors i and j (uint16 for L < 65536)
+    """
+
+    dtype = np.uint16 if L < 2**16 else np.uint32
+    index_i, index_j = np.triu_indices(L, k=1)
+    index_i = index_i.astype(dtype)
+    index_j = index_j.astype(dtype)
+    index_i.flags.writeable = False
+    index_j.flags.writeable = False
+
+    return index_i, index_j
+
+
+class PackedPairs():
+    """
+    Resolved residue pairs (j > i) of a protein in packed upper triangle order
+
+    Distances, contact classes and scores of all methods are vectors aligned with the
+    shared pair index i, j.
+    """
+
+    def __init__(self, L, i, j, cb_distance):
+        self.L = L
+        self.i = i
+        self.j = j
+        self.cb_distance = cb_distance
+
+    @classmethod
+    def from_distance_matrix(cls, distance_matrix):
+        """
+        Pack the resolved (not NAN) residue pairs of the upper triangle of a distance matrix
+
+        :param distance_matrix: L x L matrix of Cb distances
+        :return: PackedPairs
+        """
+
+        L = distance_matrix.shape[0]
+        index_i, index_j = upper_triangle_index(L)
+
+        cb_distance = np.asarray(distance_matrix[index_i, index_j], dtype=np.float32)
+        resolved = ~np.isnan(cb_distance)
+
+        return cls(L, index_i[resolved], index_j[resolved], cb_distance[resolved])
+
+    def __len__(self):
+        return len(self.cb_distance)
+
+    @property
+    def nbytes(self):
+        return self.i.nbytes + self.j.nbytes + self.cb_distance.nbytes
+
+    def sequence_separation(self):
+        return self.j.astype(np.int32) - self.i.astype(np.int32)
+
+    def true_class(self, contact_thr):
+        return self.cb_distance <= contact_thr
+
+    def gather(self, matrix):
+        """
+        Values of an L x L matrix (e.g. contact scores) at the residue pairs
+
+        :param matrix: L x L matrix
+        :return: float32 vector aligned with the residue pairs
+        """
+
+        return np.asarray(matrix[self.i, self.j], dtype=np.float32)
+
+
+class EvaluationDataset():
+    """
+    Protein structures of a benchmark data set and the residue pair data derived from them
+    """
+
+    def __init__(self, pdb_dir, distance_cache_dir=None, cache_size_mb=512):
+        self.pdb_dir = pdb_dir
+        self.pdb_files = glob.glob(self.pdb_dir +"/*pdb")
+
+        # distance maps are cached on disk and shared with other data sets and scripts
+        if distance_cache_dir is None:
+            distance_cache_dir = default_cache_dir(self.pdb_dir)
+        self.distance_cache = DistanceMapCache(distance_cache_dir)
+
+        # residue pairs and pair masks are kept in memory (least recently used proteins are evicted)
+        self.max_bytes = cache_size_mb * 1024**2
+        self.pairs = OrderedDict()
+        self.masks = {}
+        self.nbytes = 0
+
+        # the data set can be shared by threads: distance maps are computed outside of the lock
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # do not send residue pair data (and the lock) to worker processes
+        state = self.__dict__.copy()
+        state['pairs'] = OrderedDict()
+        state['masks'] = {}
+        state['nbytes'] = 0
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __evict(self):
+
+        # always keep the most recently used protein
+        while self.nbytes > self.max_bytes and len(self.pairs) > 1:
+            key, pairs = self.pairs.popitem(last=False)
+            self.nbytes -= pairs.nbytes
+            for mask_key in [mask_key for mask_key in self.masks if mask_key[:2] == key]:
+                self.nbytes -= self.masks.pop(mask_key).nbytes
+
+    def get_pairs(self, pdb_file, L):
+        """
+        Get all resolved residue pairs (j > i) of a protein sorted by i and j
+
+        :param pdb_file: path to PDB file
+        :param L: protein length
+        :return: PackedPairs
+        """
+
+        key = (pdb_file, L)
+        with self.lock:
+            if key in self.pairs:
+                self.pairs.move_to_end(key)
+                return self.pairs[key]
+
+        # determine distance matrix from PDB file (or load it from the cache)
+        distance_matrix = self.distance_cache.get(pdb_file, L)
+
+        # keep resolved residue pairs (not NAN) with j > i
+        pairs = PackedPairs.from_distance_matrix(distance_matrix)
+
+        with self.lock:
+            # another thread may have computed the same pairs meanwhile
+            if key not in self.pairs:
+                self.pairs[key] = pairs
+                self.nbytes += pairs.nbytes
+                self.__evict()
+
+        return pairs
+
+    def get_pair_mask(self, pdb_file, L, seqsep, contact_thr, noncontact_thr):
+        """
+        Get the residue pairs of a protein that are evaluated for a configuration
+
+        :param pdb_file: path to PDB file
+        :param L: protein length
+        :param seqsep: minimal sequence separation of residue pairs
+        :param contact_thr: Cb distance threshold defining a contact
+        :param noncontact_thr: Cb distance threshold defining a non-contact
+        :return: boolean vector aligned with the residue pairs from get_pairs
+        """
+
+        key = (pdb_file, L, seqsep, contact_thr, noncontact_thr)
+        with self.lock:
+            if key in self.masks:
+                return self.masks[key]
+
+        pairs = self.get_pairs(pdb_file, L)
+        cb_distance = pairs.cb_distance
+
+        # remove pairs that are separated less than SEQSEP positions along primary sequence
+        mask = pairs.sequence_separation() >= seqsep
+
+        # in case noncontact_thr != contact_thr: remove residue pairs with contact_thr < Cb distance < noncontact_thr
+        if noncontact_thr > contact_thr:
+            mask &= (cb_distance <= contact_thr) | (cb_distance > noncontact_thr)
+
+        with self.lock:
+            # masks of evicted proteins are not kept
+            if key not in self.masks and (pdb_file, L) in self.pairs:
+                self.masks[key] = mask
+                self.nbytes += mask.nbytes
+                self.__evict()
+
+        return mask
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+###     Persistent cache of C_beta distance maps computed from PDB files
+###     Distance maps are stored as .npy files that are memory-mapped on reuse,
+###     so they are shared across Benchmark objects, scripts and processes.
+###     Run this script to warm the cache for all proteins in a data set.
+# ===============================================================================
+
+### load libraries
+import argparse
+import hashlib
+import os
+import glob
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import ccmpred.io.contactmatrix
+import ccmpred.io.pdb
+import matrix_io
+
+# contact prediction directories of the benchmark scripts
+MAT_DIRS = ["predictions_pll", "predictions_pcd", "recover_pcd_constrained"]
+
+
+class DistanceMapCache():
+    """
+    On-disk cache of distance maps keyed by PDB file path, modification time and protein length L
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def __cache_file(self, pdb_file, L):
+
+        pdb_file = os.path.abspath(pdb_file)
+        mtime = os.stat(pdb_file).st_mtime_ns
+        key = hashlib.sha1("{0}:{1}:{2}".format(pdb_file, mtime, L).encode("utf-8")).hexdigest()
+
+        protein = os.path.basename(pdb_file).split(".")[0]
+        return os.path.join(self.cache_dir, "{0}.{1}.{2}.npy".format(protein, L, key[:16]))
+
+    def __write(self, cache_file, distance_matrix):
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+        matrix_io.replace_atomically(cache_file, lambda f: np.save(f, distance_matrix))
+
+    def get(self, pdb_file, L):
+        """
+        Get the distance map for a PDB file, computing and storing it if it is not cached yet
+
+        :param pdb_file: path to PDB file
+        :param L: protein length
+        :return: L x L distance matrix (memory-mapped, read-only)
+        """
+
+        if not os.path.exists(pdb_file):
+            raise IOError("PDB File " + str(pdb_file) + "does not exist. ")
+
+        cache_file = self.__cache_file(pdb_file, L)
+        if os.path.exists(cache_file):
+            return np.load(cache_file, mmap_mode='r')
+
+        distance_matrix = ccmpred.io.pdb.distance_map(pdb_file, L=L)
+
+        try:
+            self.__write(cache_file, distance_matrix)
+        except OSError as e:
+            print("Could not write distance map to cache {0}: {1}".format(self.cache_dir, e))
+            return distance_matrix
+
+        return np.load(cache_file, mmap_mode='r')
+
+
+def default_cache_dir(pdb_dir):
+    return os.path.join(pdb_dir, ".distance_maps")
+
+
+def protein_lengths(mat_dirs, filter=".mat", num_threads=8):
+    """
+    Protein lengths L of all proteins with contact predictions, as used by Benchmark ('ncol' of the meta data)
+
+    :param mat_dirs: directories with contact prediction files
+    :param filter: substring of file names, as in Benchmark.add_method
+    :param num_threads: number of threads reading meta data
+    :return: dictionary mapping proteins to the set of their lengths
+    """
+
+    lengths = {}
+    for mat_dir in mat_dirs:
+        for mat_file, meta in matrix_io.scan_matrix_meta(mat_dir, filter, num_threads=num_threads).items():
+            protein = os.path.basename(mat_file).split(".")[0]
+            L = ccmpred.io.contactmatrix.find_dict_key('ncol', meta)
+            if L is not None:
+                lengths.setdefault(protein, set()).add(L)
+
+    return lengths
+
+
+def warm_protein(cache_dir, pdb_file, L):
+    DistanceMapCache(cache_dir).get(pdb_file, L)
+    return pdb_file
+
+
+def parse_args():
+    """
+    parse command line arguments
+    :return:
+    """
+
+    parser = argparse.ArgumentParser(description='Compute and cache distance maps for all proteins in a data set.')
+    parser.add_argument("data_dir", type=str, help="path to psicov data working directory")
+    parser.add_argument("--cache-dir", type=str, default=None,
+                        help="path to distance map cache (default: DATA_DIR/pdb/.distance_maps)")
+    parser.add_argument("--mat-dir", type=str, action="append", default=None,
+                        help="directory with contact predictions whose protein lengths are used "
+                             "(repeatable, default: " + ", ".join("DATA_DIR/" + mat_dir for mat_dir in MAT_DIRS) + ")")
+    parser.add_argument("--filter", type=str, default=".mat", help="substring of contact prediction file names")
+    parser.add_argument("--num-processes", type=int, default=1, help="number of parallel processes")
+
+    args = parser.parse_args()
+
+    return args
+
+def main():
+
+    #parse command line arguments
+    args = parse_args()
+
+    data_dir = args.data_dir
+    pdb_dir = data_dir + "/pdb/"
+    mat_dirs = args.mat_dir
+    if mat_dirs is None:
+        mat_dirs = [data_dir + "/" + mat_dir + "/" for mat_dir in MAT_DIRS if os.path.isdir(data_dir + "/" + mat_dir)]
+
+    cache_dir = args.cache_dir
+    if cache_dir is None:
+        cache_dir = default_cache_dir(pdb_dir)
+
+    #protein length L is determined from the meta data of the contact predictions (as in Benchmark)
+    lengths = protein_lengths(mat_dirs, args.filter)
+    jobs = []
+    for pdb_file in glob.glob(pdb_dir + "/*pdb"):
+        protein = os.path.basename(pdb_file).split(".")[0]
+
+        if protein not in lengths:
+            print("No contact prediction available for protein {0}".format(protein))
+            continue
+
+        jobs.extend((pdb_file, L) for L in sorted(lengths[protein]))
+
+    print("Warm distance map cache in {0} for {1} proteins...".format(cache_dir, len(jobs)))
+
+    with ProcessPoolExecutor(max_workers=args.num_processes) as executor:
+        futures = [executor.submit(warm_protein, cache_dir, pdb_file, L) for pdb_file, L in jobs]
+        for id, future in enumerate(futures):
+            print(str(id + 1) + "/" + str(len(jobs)) + " " + os.path.basename(future.result()))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+###     Persistent cache of weighted amino acid frequencies of alignments
+###     Sequence weights, Neff and the degapped single and pairwise amino acid
+###     frequencies are stored as .npy files that are memory-mapped on reuse.
+###     Pairwise frequencies of the residue pairs i < j are computed and written
+###     one tile of residue blocks at a time (frequency_counts.frequency_blocks)
+###     and are stored in the order of the tiles, so no L x L x 20 x 20 array
+###     is held in memory. Entries are keyed by a hash of the alignment content
+###     and the sequence weighting, pseudocount and block settings, so the same
+###     alignment is only weighted and counted once across scripts and runs.
+# ===============================================================================
+
+### load libraries
+import hashlib
+import json
+import os
+import numpy as np
+import frequency_counts
+import matrix_io
+import sequence_weights
+
+ARRAYS = ["weights", "single_freq", "pairwise_freq"]
+
+
+def alignment_hash(alignment):
+    """
+    Hash of the content of an alignment
+
+    :param alignment: N x L alignment (integer encoded)
+    :return: sha1 hex digest
+    """
+
+    alignment = np.ascontiguousarray(alignment)
+    sha1 = hashlib.sha1("{0}:{1}:".format(alignment.shape, alignment.dtype.str).encode("utf-8"))
+    sha1.update(memoryview(alignment).cast("B"))
+    return sha1.hexdigest()
+
+
+def compute_weights(alignment, weighting_cutoff=0.8, num_threads=1):
+    """
+    Sequence weights of an alignment (same weights as ccmpred.weighting.weights_simple)
+
+    :param num_threads: number of threads computing sequence weights
+    :return: N sequence weights
+    """
+
+    return sequence_weights.weights_simple(alignment, weighting_cutoff, num_threads=num_threads)
+
+
+def cached_frequency_blocks(entry):
+    """
+    Tiles of single and pairwise frequencies of a cache entry, as generated by frequency_counts.frequency_blocks
+
+    :param entry: cache entry (FrequencyCache.get)
+    :return: generator of (columns, single_freq, indices_i, indices_j, pair_freq)
+    """
+
+    single_freq = entry['single_freq']
+    pairwise_freq = entry['pairwise_freq']
+
+    start = 0
+    for _, _, columns, indices_i, indices_j in frequency_counts.residue_tiles(single_freq.shape[0], entry['block_size']):
+        yield columns, single_freq[columns], indices_i, indices_j, pairwise_freq[start:start + len(indices_i)]
+        start += len(indices_i)
+
+
+class FrequencyCache():
+    """
+    On-disk cache of sequence weights, Neff and amino acid frequencies keyed by alignment content and settings
+    """
+
+    def __init__(self, cache_dir, weighting_cutoff=0.8, pseudocount_type="uniform_pseudocounts",
+                 pseudocount_n_single=1, pseudocount_n_pair=1, block_size=32, num_threads=1):
+        self.cache_dir = cache_dir
+        self.num_threads = num_threads
+        self.settings = {
+            'weighting_cutoff': weighting_cutoff,
+            'pseudocount_type': pseudocount_type,
+            'pseudocount_n_single': pseudocount_n_single,
+            'pseudocount_n_pair': pseudocount_n_pair,
+            'block_size': block_size
+        }
+
+    def __cache_files(self, alignment):
+
+        key = hashlib.sha1("{0}:{1}".format(
+            alignment_hash(alignment), json.dumps(self.settings, sort_keys=True)).encode("utf-8")).hexdigest()[:24]
+
+        prefix = os.path.join(self.cache_dir, "{0}.{1}".format(alignment.shape[1], key))
+        cache_files = {name: prefix + "." + name + ".npy" for name in ARRAYS}
+        cache_files['index'] = prefix + ".json"
+        return cache_files
+
+    def __write_pairwise_freq(self, f, alignment, weights, single_freq):
+
+        # tiles are appended to the .npy file as they are computed
+        L = alignment.shape[1]
+        np.lib.format.write_array_header_1_0(f, {
+            'descr': np.lib.format.dtype_to_descr(np.dtype(np.float64)),
+            'fortran_order': False,
+            'shape': (L * (L - 1) // 2, 20, 20)
+        })
+
+        blocks = frequency_counts.frequency_blocks(
+            alignment, weights, self.settings['block_size'], self.settings['pseudocount_type'],
+            self.settings['pseudocount_n_single'], self.settings['pseudocount_n_pair']
+        )
+        for columns, single_freq_tile, _, _, pair_freq in blocks:
+            single_freq[columns] = single_freq_tile
+            f.write(np.ascontiguousarray(pair_freq, dtype=np.float64).tobytes())
+
+    def __write(self, cache_files, alignment):
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+        weights = compute_weights(alignment, self.settings['weighting_cutoff'], self.num_threads)
+        single_freq = np.zeros((alignment.shape[1], 20), dtype=np.float64)
+
+        matrix_io.replace_atomically(cache_files['pairwise_freq'],
+                                     lambda f: self.__write_pairwise_freq(f, alignment, weights, single_freq))
+        matrix_io.replace_atomically(cache_files['single_freq'], lambda f: np.save(f, single_freq))
+        matrix_io.replace_atomically(cache_files['weights'], lambda f: np.save(f, weights))
+
+        # the index is written last: an entry is complete if its index exists
+        index = {'N': alignment.shape[0], 'L': alignment.shape[1], 'neff': float(np.sum(weights)),
+                 'settings': self.settings}
+        matrix_io.replace_atomically(cache_files['index'], lambda f: json.dump(index, f), mode="w")
+
+    def __read(self, cache_files):
+
+        with open(cache_files['index']) as f:
+            index = json.load(f)
+
+        entry = {name: np.load(cache_files[name], mmap_mode='r') for name in ARRAYS}
+        entry['neff'] = index['neff']
+        entry['block_size'] = index['settings']['block_size']
+        return entry
+
+    def get(self, alignment):
+        """
+        Get weights, Neff and frequencies of an alignment, computing and storing them if they are not cached yet
+
+        :param alignment: N x L alignment (integer encoded)
+        :return: dictionary with weights, neff, single_freq (L x 20), pairwise_freq (pairs i < j x 20 x 20 in the
+                 order of the tiles, see cached_frequency_blocks) and block_size; arrays are memory-mapped, read-only
+        """
+
+        cache_files = self.__cache_files(alignment)
+        if os.path.exists(cache_files['index']):
+            try:
+                return self.__read(cache_files)
+            except (IOError, ValueError) as e:
+                print("Ignore corrupt frequency cache entry {0}: {1}".format(cache_files['index'], e))
+
+        self.__write(cache_files, alignment)
+        return self.__read(cache_files)
+
+    def blocks(self, alignment):
+        """
+        Tiles of single and pairwise frequencies of an alignment (see frequency_counts.frequency_blocks),
+        read from the cache; if the cache cannot be written, they are computed without caching
+
+        :param alignment: N x L alignment (integer encoded)
+        :return: generator of (columns, single_freq, indices_i, indices_j, pair_freq)
+        """
+
+        try:
+            return cached_frequency_blocks(self.get(alignment))
+        except OSError as e:
+            print("Could not write frequencies to cache {0}: {1}".format(self.cache_dir, e))
+
+        weights = compute_weights(alignment, self.settings['weighting_cutoff'], self.num_threads)
+        return frequency_counts.frequency_blocks(
+            alignment, weights, self.settings['block_size'], self.settings['pseudocount_type'],
+            self.settings['pseudocount_n_single'], self.settings['pseudocount_n_pair']
+        )
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+###     Amino acid counts of large alignments accumulated in chunks of sequences
+###     ChunkedPseudoCounts is a ccmpred.pseudocounts.PseudoCounts whose weighted
+###     single and pairwise counts are accumulated from chunks of sequences, e.g.
+###     rows of a memory-mapped alignment with 100k sampled sequences, so only
+###     one chunk is expanded into pair indices at a time. Counts of a chunk are
+###     summed with np.bincount in the order of the sequences, only for the
+###     pairs i < j; the lower triangle and the diagonal are filled in when the
+###     counts are read. Alignments that fit into one chunk give counts
+###     identical to those of PseudoCounts(alignment, weights).
+###     frequency_blocks computes the frequencies of all residue pairs per tile
+###     of two blocks of residues, so no L x L x 21 x 21 array is allocated:
+###     single counts are computed once, the pairs between two blocks are
+###     counted with one matrix product of one-hot encoded chunks of sequences.
+# ===============================================================================
+
+### load libraries
+import numpy as np
+import ccmpred.pseudocounts
+import sequence_weights
+
+NR_STATES = 21
+
+# default number of pair indices per chunk (int64: 128 MB)
+MAX_PAIR_INDICES = 2**24
+
+# default number of one-hot entries per chunk and block of residues (float64: 32 MB)
+MAX_ONE_HOT = 2**22
+
+
+class ChunkedPseudoCounts(ccmpred.pseudocounts.PseudoCounts):
+    """
+    PseudoCounts of an alignment that is added in chunks of sequences
+
+    Only the pairs i < j are counted, the full L x L x 21 x 21 pair counts (lower triangle mirrored,
+    diagonal from the single counts) are assembled when counts is read.
+    """
+
+    def __init__(self, L):
+
+        # PseudoCounts.__init__ is not called: it counts a complete alignment at once
+        self.msa = None
+        self.N = 0
+        self.L = L
+        self.weights = np.zeros(0, dtype=np.float64)
+        self.neff = 0.0
+        self.freqs = None
+
+        self.__pairs_i, self.__pairs_j = np.triu_indices(L, k=1)
+        self.__single_counts = np.zeros((L, NR_STATES), dtype=np.float64)
+        self.__pair_counts = np.zeros((len(self.__pairs_i), NR_STATES, NR_STATES), dtype=np.float64)
+
+        # flat index of (i, 0) in the single counts and of (pair, 0, 0) in the pair counts
+        self.__single_offsets = np.arange(L, dtype=np.int64) * NR_STATES
+        self.__pair_offsets = np.arange(len(self.__pairs_i), dtype=np.int64) * NR_STATES * NR_STATES
+
+    @property
+    def counts(self):
+
+        L = self.L
+        single_counts = self.__single_counts.copy()
+        pair_counts = np.zeros((L, L, NR_STATES, NR_STATES), dtype=np.float64)
+        pair_counts[self.__pairs_i, self.__pairs_j] = self.__pair_counts
+        pair_counts[self.__pairs_j, self.__pairs_i] = self.__pair_counts.transpose(0, 2, 1)
+
+        # a sequence has the same amino acid at i on both sides of the pair (i, i)
+        positions = np.arange(L)
+        pair_counts[positions, positions, :, :] = single_counts[:, :, np.newaxis] * np.eye(NR_STATES)
+
+        return single_counts, pair_counts
+
+    def add(self, alignment, weights):
+        """
+        Add the weighted counts of a chunk of sequences
+
+        :param alignment: B x L alignment (integer encoded)
+        :param weights: B sequence weights
+        """
+
+        alignment = np.asarray(alignment, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+        nr_sequences = alignment.shape[0]
+
+        # bincount adds the weights of a chunk in the order of the sequences
+        single_index = self.__single_offsets + alignment
+        self.__single_counts += np.bincount(
+            single_index.ravel(), weights=np.repeat(weights, self.L), minlength=self.__single_counts.size
+        ).reshape(self.__single_counts.shape)
+
+        pair_index = self.__pair_offsets + alignment[:, self.__pairs_i] * NR_STATES + alignment[:, self.__pairs_j]
+        self.__pair_counts += np.bincount(
+            pair_index.ravel(), weights=np.repeat(weights, len(self.__pairs_i)), minlength=self.__pair_counts.size
+        ).reshape(self.__pair_counts.shape)
+
+        self.N += nr_sequences
+        self.weights = np.concatenate([self.weights, weights])
+        self.neff = np.sum(self.weights)
+
+
+def chunk_size(L, max_pair_indices=MAX_PAIR_INDICES):
+    """
+    Number of sequences per chunk such that a chunk has at most max_pair_indices pair indices
+    """
+
+    return max(1, max_pair_indices // max(1, L * (L - 1) // 2))
+
+
+def chunked_pseudocounts(alignment, weights, nr_sequences_per_chunk=None):
+    """
+    PseudoCounts of an alignment accumulated in chunks of sequences
+
+    :param alignment: N x L alignment (integer encoded, may be memory-mapped)
+    :param weights: N sequence weights
+    :param nr_sequences_per_chunk: number of sequences per chunk (default: chunk_size(L))
+    :return: ChunkedPseudoCounts
+    """
+
+    nr_sequences, L = alignment.shape
+    if nr_sequences_per_chunk is None:
+        nr_sequences_per_chunk = chunk_size(L)
+
+    pseudocounts = ChunkedPseudoCounts(L)
+    for start in range(0, nr_sequences, nr_sequences_per_chunk):
+        pseudocounts.add(alignment[start:start + nr_sequences_per_chunk], weights[start:start + nr_sequences_per_chunk])
+
+    return pseudocounts
+
+
+class BlockPseudoCounts(ccmpred.pseudocounts.PseudoCounts):
+    """
+    PseudoCounts of the columns of one tile of residue blocks, built from precomputed counts
+    """
+
+    def __init__(self, single_counts, pair_counts):
+
+        # PseudoCounts.__init__ is not called: the counts are computed by frequency_blocks
+        self.msa = None
+        self.N = None
+        self.L = single_counts.shape[0]
+        self.weights = None
+        self.neff = np.sum(single_counts[0, :])
+        self.counts = single_counts, pair_counts
+        self.freqs = None
+
+
+def single_counts(alignment, weights, nr_sequences_per_chunk=None):
+    """
+    Weighted single counts of an alignment accumulated in chunks of sequences
+
+    :param alignment: N x L alignment (integer encoded, may be memory-mapped)
+    :param weights: N sequence weights
+    :param nr_sequences_per_chunk: number of sequences per chunk (default: chunk_size(L))
+    :return: L x 21 single counts
+    """
+
+    nr_sequences, L = alignment.shape
+    if nr_sequences_per_chunk is None:
+        nr_sequences_per_chunk = chunk_size(L)
+
+    offsets = np.arange(L, dtype=np.int64) * NR_STATES
+    counts = np.zeros(L * NR_STATES, dtype=np.float64)
+    for start in range(0, nr_sequences, nr_sequences_per_chunk):
+        chunk = np.asarray(alignment[start:start + nr_sequences_per_chunk], dtype=np.int64)
+        counts += np.bincount((offsets + chunk).ravel(),
+                              weights=np.repeat(weights[start:start + nr_sequences_per_chunk], L),
+                              minlength=counts.size)
+
+    return counts.reshape(L, NR_STATES)
+
+
+def cross_counts(alignment, weights, columns_i, columns_j, max_one_hot=MAX_ONE_HOT):
+    """
+    Weighted pair counts of all pairs of a column of columns_i and a column of columns_j
+
+    Each chunk of sequences is one-hot encoded for both sets of columns and counted with one matrix product.
+
+    :param alignment: N x L alignment (integer encoded, may be memory-mapped)
+    :param weights: N sequence weights
+    :param columns_i: columns i
+    :param columns_j: columns j
+    :param max_one_hot: maximal number of entries of the one-hot encoding of a chunk
+    :return: len(columns_i) x len(columns_j) x 21 x 21 pair counts
+    """
+
+    nr_sequences = alignment.shape[0]
+    nr_sequences_per_chunk = max(1, max_one_hot // (max(len(columns_i), len(columns_j)) * NR_STATES))
+
+    counts = np.zeros((len(columns_i) * NR_STATES, len(columns_j) * NR_STATES), dtype=np.float64)
+    for start in range(0, nr_sequences, nr_sequences_per_chunk):
+        chunk = np.asarray(alignment[start:start + nr_sequences_per_chunk])
+        chunk_weights = np.asarray(weights[start:start + nr_sequences_per_chunk], dtype=np.float64)
+        one_hot_i = sequence_weights.one_hot(chunk[:, columns_i], NR_STATES) * chunk_weights[:, np.newaxis]
+        one_hot_j = sequence_weights.one_hot(chunk[:, columns_j], NR_STATES).astype(np.float64)
+        counts += np.dot(one_hot_i.T, one_hot_j)
+
+    return counts.reshape(len(columns_i), NR_STATES, len(columns_j), NR_STATES).transpose(0, 2, 1, 3)
+
+
+def residue_tiles(L, block_size=32):
+    """
+    Tiles of residue pairs i < j: all pairs within a block of block_size residues and between two blocks
+
+    :param L: number of residues
+    :param block_size: number of residues per block
+    :return: generator of (columns_i, columns_j, columns, indices_i, indices_j) with the residues of both blocks
+             (the same block for tiles on the diagonal), the residues of the tile and its pairs as indices into columns
+    """
+
+    blocks = [np.arange(start, min(start + block_size, L)) for start in range(0, L, block_size)]
+
+    for block_i in range(len(blocks)):
+        for block_j in range(block_i, len(blocks)):
+
+            if block_i == block_j:
+                columns = blocks[block_i]
+                indices_i, indices_j = np.triu_indices(len(columns), k=1)
+            else:
+                columns = np.concatenate([blocks[block_i], blocks[block_j]])
+                indices_i, indices_j = np.meshgrid(
+                    np.arange(len(blocks[block_i])), len(blocks[block_i]) + np.arange(len(blocks[block_j])),
+                    indexing='ij')
+                indices_i, indices_j = indices_i.ravel(), indices_j.ravel()
+
+            yield blocks[block_i], blocks[block_j], columns, indices_i, indices_j
+
+
+def frequency_blocks(alignment, weights, block_size=32, pseudocount_type="uniform_pseudocounts",
+                     pseudocount_n_single=1, pseudocount_n_pair=1):
+    """
+    Degapped single and pairwise amino acid frequencies of all residue pairs i < j, one tile of residue blocks at a time
+
+    The residues are split into blocks of block_size columns (residue_tiles). The single counts are computed once;
+    for every pair of blocks only the pairs between both blocks are counted (cross_counts). The counts of the
+    columns of a tile are turned into frequencies with PseudoCounts.calculate_frequencies, whose frequencies of
+    a pair (i, j) only depend on the counts of i, j and (i, j). Memory is bounded by (2 * block_size)^2 * 21^2
+    counts. Tiles are generated in the same order for alignments of the same length.
+
+    :param alignment: N x L alignment (integer encoded, may be memory-mapped)
+    :param weights: N sequence weights
+    :param block_size: number of residues per block
+    :return: generator of (columns, single_freq, indices_i, indices_j, pair_freq) with the residues of this
+             tile, their single frequencies (C x 20), the pairs of the tile as indices into columns and their
+             pairwise frequencies (number of pairs x 20 x 20)
+    """
+
+    counts = single_counts(alignment, weights)
+
+    for columns_i, columns_j, columns, indices_i, indices_j in residue_tiles(alignment.shape[1], block_size):
+
+        if columns_i is columns_j:
+            pair_counts = cross_counts(alignment, weights, columns, columns)
+        else:
+            # only the pairs between both blocks are counted, all other pair counts of the tile stay zero
+            pair_counts = np.zeros((len(columns), len(columns), NR_STATES, NR_STATES), dtype=np.float64)
+            pair_counts[:len(columns_i), len(columns_i):] = cross_counts(alignment, weights, columns_i, columns_j)
+
+        pseudocounts = BlockPseudoCounts(counts[columns], pair_counts)
+        pseudocounts.calculate_frequencies(
+            pseudocount_type, pseudocount_n_single, pseudocount_n_pair, remove_gaps=False
+        )
+        single_freq, pair_freq = pseudocounts.freqs
+
+        yield (
+            columns,
+            pseudocounts.degap(single_freq, False),
+            indices_i,
+            indices_j,
+            pseudocounts.degap(pair_freq, False)[indices_i, indices_j]
+        )
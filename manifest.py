@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+###     Manifest of all files in a data directory
+###     Indexes the files in the subdirectories of the data directory
+###     (predictions_pll/, recover_pcd_constrained/, samples_*/, aln/, ...)
+###     with protein, kind, topology, size, modification time and the meta
+###     data of contact matrices. Scripts resolve files from the manifest
+###     instead of globbing directories and checking every file.
+###     Run this script to build or incrementally refresh the manifest.
+###     Scripts refresh it on start; directories whose modification time did
+###     not change since the last refresh (no file added, removed or renamed)
+###     are not listed again.
+# ===============================================================================
+
+### load libraries
+import argparse
+import fnmatch
+import glob
+import json
+import os
+import matrix_io
+
+MANIFEST_FILE = ".manifest.json"
+TOPOLOGIES = ["star", "binary"]
+META_KINDS = (".mat", matrix_io.SPARSE_EXTENSION)
+
+
+def describe_file(name):
+    """
+    Protein, kind and topology of a file from its name, e.g. 1abc.apc.star.mat -> 1abc, apc.mat, star
+
+    :param name: file name
+    :return: protein, kind, topology (None if the name does not contain a topology)
+    """
+
+    fields = name.split(".")
+    topology = None
+    for topology_name in TOPOLOGIES:
+        if topology_name in fields[1:]:
+            topology = topology_name
+            fields.remove(topology_name)
+
+    return fields[0], ".".join(fields[1:]), topology
+
+
+class Manifest():
+    """
+    Index of the files in the subdirectories of a data directory
+    """
+
+    def __init__(self, data_dir, manifest_file=None):
+        self.data_dir = os.path.abspath(data_dir)
+        self.manifest_file = manifest_file
+        if manifest_file is None:
+            self.manifest_file = os.path.join(self.data_dir, MANIFEST_FILE)
+
+        # relative directory -> file name -> entry
+        self.directories = {}
+
+        # relative directory -> modification time (ns) when it was last listed
+        self.directory_mtimes = {}
+
+        # directories listed by this process: their entries match the files on disk
+        self.__listed = set()
+
+    def load(self):
+
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file) as f:
+                manifest = json.load(f)
+            self.directories = manifest['directories']
+            self.directory_mtimes = manifest.get('directory_mtimes', {})
+
+        return self
+
+    def save(self):
+
+        manifest = {'data_dir': self.data_dir, 'directories': self.directories,
+                    'directory_mtimes': self.directory_mtimes}
+        matrix_io.replace_atomically(self.manifest_file, lambda f: json.dump(manifest, f), mode="w")
+
+    def refresh(self, num_threads=8, full=False):
+        """
+        Update the manifest: add new files, drop deleted files and re-read the meta data of modified files
+
+        Only directories whose modification time changed are listed again, unless full is set. Files that are
+        modified in place do not change the modification time of their directory: current_entry checks them.
+
+        :param num_threads: number of threads reading meta data
+        :param full: list all directories
+        :return: number of added or modified files, number of deleted files
+        """
+
+        directories = {}
+        directory_mtimes = {}
+        changed_files = []
+        nr_deleted = 0
+
+        for dir_entry in sorted(os.scandir(self.data_dir), key=lambda dir_entry: dir_entry.name):
+            directory = dir_entry.name
+            if directory.startswith(".") or directory == "plots" or not dir_entry.is_dir():
+                continue
+
+            # the modification time is taken before listing: files added meanwhile are found next time
+            dir_path = dir_entry.path
+            directory_mtimes[directory] = dir_entry.stat().st_mtime_ns
+            if (not full and directory in self.directories and
+                    self.directory_mtimes.get(directory) == directory_mtimes[directory]):
+                directories[directory] = self.directories[directory]
+                continue
+
+            self.__listed.add(directory)
+            old_entries = self.directories.get(directory, {})
+            entries = {}
+            for dir_entry in os.scandir(dir_path):
+                if dir_entry.name.startswith(".") or not dir_entry.is_file():
+                    continue
+
+                stat = dir_entry.stat()
+                entry = old_entries.get(dir_entry.name)
+                if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+                    protein, kind, topology = describe_file(dir_entry.name)
+                    entry = {
+                        'protein': protein,
+                        'kind': kind,
+                        'topology': topology,
+                        'size': stat.st_size,
+                        'mtime_ns': stat.st_mtime_ns,
+                        'meta': None
+                    }
+                    changed_files.append((directory, dir_entry.name))
+                entries[dir_entry.name] = entry
+
+            nr_deleted += len(set(old_entries) - set(entries))
+            directories[directory] = entries
+
+        nr_deleted += sum(len(entries) for directory, entries in self.directories.items() if directory not in directories)
+
+        # read the header meta data of new and modified contact matrices
+        mat_files = {os.path.join(self.data_dir, directory, name): (directory, name)
+                     for directory, name in changed_files if name.endswith(META_KINDS)}
+        meta = matrix_io.read_matrix_meta_batch(list(mat_files.keys()), num_threads=num_threads)
+        for mat_file, (directory, name) in mat_files.items():
+            directories[directory][name]['meta'] = meta[mat_file]
+
+        self.directories = directories
+        self.directory_mtimes = directory_mtimes
+
+        return len(changed_files), nr_deleted
+
+    def __directory(self, path):
+
+        # indexed directory (relative to the data directory) containing path or None
+        directory = os.path.relpath(os.path.dirname(os.path.abspath(path)), self.data_dir)
+        if directory in self.directories:
+            return directory
+        return None
+
+    def glob(self, pattern):
+        """
+        Drop-in replacement for glob.glob(pattern) for patterns in indexed directories
+
+        :param pattern: directory + "/" + file name pattern
+        :return: list of paths
+        """
+
+        directory = self.__directory(pattern)
+        if directory is None:
+            return glob.glob(pattern)
+
+        dir_pattern, name_pattern = os.path.split(pattern)
+        return [os.path.join(dir_pattern, name)
+                for name in fnmatch.filter(sorted(self.directories[directory]), name_pattern)]
+
+    def exists(self, path):
+        """
+        Drop-in replacement for os.path.exists(path) for files in indexed directories
+        """
+
+        directory = self.__directory(path)
+        if directory is None:
+            return os.path.exists(path)
+
+        return os.path.basename(path) in self.directories[directory]
+
+    def entry(self, path):
+        """
+        Manifest entry (protein, kind, topology, size, mtime_ns, meta) of a file or None
+        """
+
+        directory = self.__directory(path)
+        if directory is None:
+            return None
+
+        return self.directories[directory].get(os.path.basename(path))
+
+    def current_entry(self, path):
+        """
+        Manifest entry of a file if size and modification time still match the file on disk, otherwise None
+
+        Entries of directories listed by the last refresh of this manifest are taken from that listing.
+        """
+
+        entry = self.entry(path)
+        if entry is None:
+            return None
+
+        # entries of directories listed by this process were just taken from the file system
+        if self.__directory(path) in self.__listed:
+            return entry
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        if entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            return None
+        return entry
+
+    def files(self, kind=None, topology=None, protein=None):
+        """
+        Paths of all indexed files of a kind, topology and/or protein
+
+        :return: list of paths
+        """
+
+        paths = []
+        for directory, entries in sorted(self.directories.items()):
+            for name, entry in sorted(entries.items()):
+                if ((kind is None or entry['kind'] == kind) and
+                        (topology is None or entry['topology'] == topology) and
+                        (protein is None or entry['protein'] == protein)):
+                    paths.append(os.path.join(self.data_dir, directory, name))
+
+        return paths
+
+
+class FileSystem():
+    """
+    Same interface as Manifest, but files are looked up directly in the file system
+    """
+
+    def glob(self, pattern):
+        return glob.glob(pattern)
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def entry(self, path):
+        return None
+
+    def current_entry(self, path):
+        return None
+
+
+def file_index(data_dir, use_manifest=False):
+    """
+    Manifest of the data directory (built if it does not exist, refreshed otherwise) or direct access to the file system
+
+    The refresh only lists directories that changed and re-reads new or modified files.
+
+    :param data_dir: path to data directory
+    :param use_manifest: resolve files from the manifest
+    :return: Manifest or FileSystem
+    """
+
+    if use_manifest:
+        return load_manifest(data_dir, refresh=True)
+    return FileSystem()
+
+
+def load_manifest(data_dir, refresh=False, num_threads=8):
+    """
+    Load the manifest of a data directory, building it if it does not exist yet
+
+    :param data_dir: path to data directory
+    :param refresh: update the manifest with new, modified and deleted files
+    :param num_threads: number of threads reading meta data
+    :return: Manifest
+    """
+
+    manifest = Manifest(data_dir).load()
+    if refresh or not os.path.exists(manifest.manifest_file):
+        directory_mtimes = dict(manifest.directory_mtimes)
+        nr_changed, nr_deleted = manifest.refresh(num_threads=num_threads)
+        if (nr_changed > 0 or nr_deleted > 0 or manifest.directory_mtimes != directory_mtimes or
+                not os.path.exists(manifest.manifest_file)):
+            manifest.save()
+
+    return manifest
+
+
+def parse_args():
+    """
+    parse command line arguments
+    :return:
+    """
+
+    parser = argparse.ArgumentParser(description='Build or refresh the manifest of all files in a data directory.')
+    parser.add_argument("data_dir", type=str, help="path to psicov data working directory")
+    parser.add_argument("--num-threads", type=int, default=8, help="number of threads reading meta data of contact matrices")
+    parser.add_argument("--rebuild", action="store_true", default=False, help="discard the existing manifest")
+
+    args = parser.parse_args()
+
+    return args
+
+def main():
+
+    #parse command line arguments
+    args = parse_args()
+
+    manifest = Manifest(args.data_dir)
+    if not args.rebuild:
+        manifest.load()
+
+    nr_changed, nr_deleted = manifest.refresh(num_threads=args.num_threads, full=True)
+    manifest.save()
+
+    nr_files = sum(len(entries) for entries in manifest.directories.values())
+    print("Manifest {0}: {1} files in {2} directories ({3} new or modified, {4} deleted).".format(
+        manifest.manifest_file, nr_files, len(manifest.directories), nr_changed, nr_deleted))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,457 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+###     Fast access to contact matrix files written by CCMpredPy
+###     and to compact formats converted from them (see convert_matrices.py):
+###     - sparse top-N files (*.top.npz) with the highest scoring residue pairs
+###     - binary float32 copies of text matrices (.binary/*.npy + *.json) that
+###       are memory-mapped and preferred over the text matrix when up to date
+###     - archives of all matrices of a method: one float32 .npy file with the
+###       concatenated matrices and a JSON index (*.archive.json) with offset,
+###       length and meta data per file; members are addressed as
+###       "<index file>::<file name>"
+# ===============================================================================
+
+### load libraries
+import glob
+import gzip
+import json
+import hashlib
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import ccmpred.io.contactmatrix
+
+META_TAG = b"#>META>"
+SPARSE_EXTENSION = ".top.npz"
+BINARY_DIR = ".binary"
+ARCHIVE_EXTENSION = ".archive.json"
+ARCHIVE_SEPARATOR = "::"
+
+# archives opened by this process: index file -> (index, memory-mapped data)
+_open_archives = {}
+
+
+def _parse_meta_line(line):
+    return json.loads(line.decode("utf-8").split("> ", 1)[1])
+
+
+def _read_meta_backwards(mat_file, block_size=65536):
+
+    # CCMpredPy appends the meta data as the last line of the matrix file
+    with open(mat_file, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        buffer = b""
+
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            buffer = f.read(read_size) + buffer
+
+            start = buffer.rfind(META_TAG)
+            if start >= 0:
+                end = buffer.find(b"\n", start)
+                return _parse_meta_line(buffer[start:end if end >= 0 else None])
+
+    return {}
+
+
+def _read_meta_gzip(mat_file):
+
+    # compressed files cannot be read backwards: scan lines without parsing numbers
+    with gzip.open(mat_file, "rb") as f:
+        for line in f:
+            if line.startswith(META_TAG):
+                return _parse_meta_line(line)
+
+    return {}
+
+
+def _read_meta_sparse(sparse_file):
+
+    # members of npz files are loaded lazily: the residue pairs are not read
+    with np.load(sparse_file, allow_pickle=False) as npz:
+        return json.loads(str(npz['meta']))
+
+
+def _read_meta_binary(json_file):
+    with open(json_file) as f:
+        return json.load(f)
+
+
+def read_matrix_meta(mat_file):
+    """
+    Read the meta data of a contact matrix file without parsing the matrix
+
+    :param mat_file: path to contact matrix file
+    :return: meta data
+    """
+
+    if is_archive_member(mat_file):
+        return read_archive_entry(mat_file)['meta']
+
+    if not os.path.exists(mat_file):
+        raise IOError("Matrix File " + str(mat_file) + "cannot be found. ")
+
+    binary_files = current_binary_matrix_files(mat_file)
+    if binary_files is not None:
+        meta = _read_meta_binary(binary_files[1])
+    elif mat_file.endswith(SPARSE_EXTENSION):
+        meta = _read_meta_sparse(mat_file)
+    elif mat_file.endswith(".gz"):
+        meta = _read_meta_gzip(mat_file)
+    else:
+        meta = _read_meta_backwards(mat_file)
+
+    if len(meta) == 0:
+        print(str(mat_file) + " does not contain META info. (Line must start with #META!)")
+
+    return meta
+
+
+def read_matrix_meta_batch(mat_files, num_threads=8):
+    """
+    Read the meta data of many contact matrix files using a thread pool
+
+    :param mat_files: list of paths to contact matrix files
+    :param num_threads: number of threads
+    :return: dictionary mapping file paths to meta data
+    """
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        return dict(zip(mat_files, executor.map(read_matrix_meta, mat_files)))
+
+
+def scan_matrix_meta(mat_dir, filter="", num_threads=8):
+    """
+    Read the meta data of all contact matrix files in a directory
+
+    :param mat_dir: path to directory with contact matrix files
+    :param filter: substring of file names, as in Benchmark.add_method
+    :param num_threads: number of threads
+    :return: dictionary mapping file paths to meta data
+    """
+
+    return read_matrix_meta_batch(glob.glob(mat_dir + "/*" + filter + "*"), num_threads=num_threads)
+
+
+def write_sparse_matrix(sparse_file, mat, meta, top, min_seqsep=1):
+    """
+    Write the top scoring residue pairs (j > i) of a contact matrix to a sparse file
+
+    :param sparse_file: path to output file (*.top.npz)
+    :param mat: L x L contact matrix
+    :param meta: meta data of the contact matrix
+    :param top: number of residue pairs that are kept
+    :param min_seqsep: minimal sequence separation of residue pairs that are kept
+    :return:
+    """
+
+    L = mat.shape[0]
+    indices_i, indices_j = np.triu_indices(L, k=min_seqsep)
+    scores = mat[indices_i, indices_j]
+
+    # keep the top scoring pairs sorted by decreasing score
+    top = min(top, len(scores))
+    selected = np.argpartition(-scores, top - 1)[:top] if 0 < top < len(scores) else np.arange(top)
+    selected = selected[np.argsort(-scores[selected], kind='stable')]
+
+    index_dtype = np.uint16 if L < 2**16 else np.uint32
+    with open(sparse_file, "wb") as f:
+        np.savez_compressed(
+            f,
+            L=np.array(L),
+            min_seqsep=np.array(min_seqsep),
+            i=indices_i[selected].astype(index_dtype),
+            j=indices_j[selected].astype(index_dtype),
+            score=scores[selected].astype(np.float32),
+            meta=np.array(json.dumps(meta))
+        )
+
+
+def read_sparse_pairs(sparse_file):
+    """
+    Read the residue pairs of a sparse top-N file
+
+    :param sparse_file: path to sparse file (*.top.npz)
+    :return: protein length L, index vectors i and j, scores (sorted by decreasing score), meta data
+    """
+
+    with np.load(sparse_file, allow_pickle=False) as npz:
+        return int(npz['L']), npz['i'], npz['j'], npz['score'], json.loads(str(npz['meta']))
+
+
+def read_min_seqsep(mat_file):
+    """
+    Minimal sequence separation of the residue pairs stored in a contact matrix file
+
+    Sparse top-N files (and archived copies of them) only store pairs with a sequence separation of at least
+    the min_seqsep they were written with, all other files store all pairs.
+
+    :param mat_file: path to contact matrix file
+    :return: minimal sequence separation
+    """
+
+    if is_archive_member(mat_file):
+        return read_archive_entry(mat_file).get('min_seqsep', 1)
+
+    if not mat_file.endswith(SPARSE_EXTENSION):
+        return 1
+
+    # members of npz files are loaded lazily: the residue pairs are not read
+    with np.load(mat_file, allow_pickle=False) as npz:
+        return int(npz['min_seqsep'])
+
+
+def read_sparse_matrix(sparse_file):
+    """
+    Read a sparse top-N file as a dense contact matrix
+
+    Residue pairs that are not stored in the file have score NAN and are ranked last.
+
+    :param sparse_file: path to sparse file (*.top.npz)
+    :return: L x L float32 contact matrix, meta data
+    """
+
+    L, indices_i, indices_j, scores, meta = read_sparse_pairs(sparse_file)
+
+    mat = np.full((L, L), np.nan, dtype=np.float32)
+    mat[indices_i, indices_j] = scores
+    mat[indices_j, indices_i] = scores
+
+    return mat, meta
+
+
+def binary_matrix_files(mat_file):
+    """
+    Paths of the binary copy of a text contact matrix file
+
+    :param mat_file: path to contact matrix file
+    :return: path to float32 .npy file, path to JSON file with meta data
+    """
+
+    binary_file = os.path.join(os.path.dirname(mat_file), BINARY_DIR, os.path.basename(mat_file))
+    return binary_file + ".npy", binary_file + ".json"
+
+
+def current_binary_matrix_files(mat_file):
+    """
+    Paths of the binary copy of a text contact matrix file if it exists and is not older than the text file
+
+    :param mat_file: path to contact matrix file
+    :return: path to .npy file, path to JSON file or None
+    """
+
+    npy_file, json_file = binary_matrix_files(mat_file)
+    try:
+        binary_mtime = min(os.stat(npy_file).st_mtime_ns, os.stat(json_file).st_mtime_ns)
+        if binary_mtime >= os.stat(mat_file).st_mtime_ns:
+            return npy_file, json_file
+    except OSError:
+        pass
+
+    return None
+
+
+def replace_atomically(target_file, write, mode="wb"):
+    """
+    Write a file through a temporary file in the same directory that replaces the target once it is complete
+
+    :param target_file: path to file
+    :param write: function writing the content to an open file object
+    :param mode: file mode ("wb" or "w")
+    :return:
+    """
+
+    # write to a temporary file first, so that concurrent readers never see a partial file
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(target_file)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        os.replace(tmp_file, target_file)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+
+def write_binary_matrix(mat_file, mat, meta):
+    """
+    Write the binary copy (float32 .npy and JSON meta data) of a text contact matrix file
+
+    :param mat_file: path to contact matrix file
+    :param mat: L x L contact matrix
+    :param meta: meta data of the contact matrix
+    :return: path to .npy file, path to JSON file
+    """
+
+    npy_file, json_file = binary_matrix_files(mat_file)
+    if not os.path.exists(os.path.dirname(npy_file)):
+        os.makedirs(os.path.dirname(npy_file), exist_ok=True)
+
+    # the meta data is written last: the binary copy is only used once both files are newer than the text file
+    replace_atomically(npy_file, lambda f: np.save(f, np.asarray(mat, dtype=np.float32)))
+    replace_atomically(json_file, lambda f: json.dump(meta, f), mode="w")
+
+    return npy_file, json_file
+
+
+def read_binary_matrix(npy_file, json_file):
+    """
+    Read a binary contact matrix
+
+    :param npy_file: path to float32 .npy file
+    :param json_file: path to JSON file with meta data
+    :return: L x L float32 contact matrix (memory-mapped, read-only), meta data
+    """
+
+    return np.load(npy_file, mmap_mode='r'), _read_meta_binary(json_file)
+
+
+def archive_files(archive_prefix):
+    """
+    Paths of the index and data file of a matrix archive
+
+    :param archive_prefix: path to archive without extension
+    :return: path to JSON index file, path to float32 .npy data file
+    """
+
+    return archive_prefix + ARCHIVE_EXTENSION, archive_prefix + ".archive.npy"
+
+
+def write_archive(archive_prefix, matrices):
+    """
+    Write contact matrices into one archive
+
+    :param archive_prefix: path to archive without extension
+    :param matrices: iterable of (file name, L x L contact matrix, meta data, min_seqsep (see read_min_seqsep))
+    :return: path to JSON index file
+    """
+
+    index_file, data_file = archive_files(archive_prefix)
+    archive_dir = os.path.dirname(os.path.abspath(index_file))
+
+    # append matrices to a raw temporary file, then prepend the .npy header once the total size is known
+    index = {'data_file': os.path.basename(data_file), 'dtype': '<f4', 'entries': {}}
+    offset = 0
+    with tempfile.TemporaryFile(dir=archive_dir) as raw:
+        for name, mat, meta, min_seqsep in matrices:
+            data = np.ascontiguousarray(mat, dtype='<f4').tobytes()
+            raw.write(data)
+            index['entries'][name] = {
+                'offset': offset,
+                'L': int(mat.shape[0]),
+                'sha1': hashlib.sha1(data).hexdigest(),
+                'min_seqsep': int(min_seqsep),
+                'meta': meta
+            }
+            offset += mat.shape[0] * mat.shape[0]
+
+        def write_data(f):
+            np.lib.format.write_array_header_1_0(f, {'descr': '<f4', 'fortran_order': False, 'shape': (offset,)})
+            raw.seek(0)
+            shutil.copyfileobj(raw, f)
+
+        replace_atomically(data_file, write_data)
+
+    # the index is written last: readers never see an index that points into a partial data file
+    index['size'] = offset
+    replace_atomically(index_file, lambda f: json.dump(index, f), mode="w")
+
+    return index_file
+
+
+def is_archive_member(mat_file):
+    return ARCHIVE_SEPARATOR in mat_file
+
+
+def archive_members(index_file, filter=""):
+    """
+    Addresses of the matrices in an archive
+
+    :param index_file: path to JSON index file of the archive
+    :param filter: substring of the names of the archived files, as in Benchmark.add_method
+    :return: list of "<index file>::<file name>"
+    """
+
+    index, _ = open_archive(index_file)
+    return [index_file + ARCHIVE_SEPARATOR + name for name in sorted(index['entries']) if filter in name]
+
+
+def open_archive(index_file):
+    """
+    Open a matrix archive once per process
+
+    :param index_file: path to JSON index file of the archive
+    :return: index, memory-mapped data
+    """
+
+    if index_file in _open_archives:
+        return _open_archives[index_file]
+
+    with open(index_file) as f:
+        index = json.load(f)
+    data = np.load(os.path.join(os.path.dirname(index_file), index['data_file']), mmap_mode='r')
+    if data.shape != (index['size'],):
+        raise IOError("Archive data file does not match index " + str(index_file))
+
+    _open_archives[index_file] = (index, data)
+    return _open_archives[index_file]
+
+
+def read_archive_entry(member):
+    """
+    Index entry (offset, L, sha1, min_seqsep and meta data) of an archived matrix
+
+    :param member: "<index file>::<file name>"
+    :return: dictionary
+    """
+
+    index_file, name = member.rsplit(ARCHIVE_SEPARATOR, 1)
+    index, _ = open_archive(index_file)
+    if name not in index['entries']:
+        raise IOError("Matrix File " + str(name) + " cannot be found in archive " + str(index_file))
+
+    return index['entries'][name]
+
+
+def read_archive_matrix(member):
+    """
+    Read an archived matrix
+
+    :param member: "<index file>::<file name>"
+    :return: L x L float32 contact matrix (memory-mapped, read-only), meta data
+    """
+
+    index_file, _ = member.rsplit(ARCHIVE_SEPARATOR, 1)
+    _, data = open_archive(index_file)
+    entry = read_archive_entry(member)
+
+    L = entry['L']
+    return data[entry['offset']:entry['offset'] + L * L].reshape(L, L), entry['meta']
+
+
+def read_matrix(mat_file):
+    """
+    Read a contact matrix from a text matrix file, a sparse top-N file or an archive
+
+    An up to date binary copy of a text matrix file is read instead of the text file.
+
+    :param mat_file: path to contact matrix file
+    :return: L x L contact matrix, meta data
+    """
+
+    if is_archive_member(mat_file):
+        return read_archive_matrix(mat_file)
+
+    binary_files = current_binary_matrix_files(mat_file)
+    if binary_files is not None:
+        return read_binary_matrix(*binary_files)
+
+    if mat_file.endswith(SPARSE_EXTENSION):
+        return read_sparse_matrix(mat_file)
+
+    return ccmpred.io.contactmatrix.read_matrix(mat_file)
@@ -12,6 +12,8 @@
 import argparse
 import os
 from benchmark import Benchmark
+import statistics_io
+from manifest import file_index
 import copy
 from plotly.offline import plot as plotly_plot
 
@@ -89,6 +91,15 @@ def parse_args():
 
     parser = argparse.ArgumentParser(description='Plot CCMgen paper Figure 1C.')
     parser.add_argument("data_dir", type=str, help="path to psicov data working directory")
+    parser.add_argument("--num-processes", type=int, default=1, help="number of processes used to evaluate proteins")
+    parser.add_argument("--results-cache-dir", type=str, default=None,
+                        help="reuse evaluation metrics of unchanged predictions stored in this directory")
+    parser.add_argument("--statistics-dir", type=str, default=None,
+                        help="load evaluation statistics from this directory if available, otherwise write them there")
+    parser.add_argument("--profile-dir", type=str, default=None,
+                        help="write timings per stage, protein and method of the benchmark run to this directory")
+    parser.add_argument("--manifest", action="store_true", default=False,
+                        help="resolve files from the manifest of DATA_DIR (built if missing, refreshed incrementally)")
 
     args = parser.parse_args()
 
@@ -101,32 +112,54 @@ def main():
 
     data_dir = args.data_dir
     plot_dir = data_dir+"/plots/benchmarks/"
+    files = file_index(data_dir, args.manifest)
 
     if not os.path.exists(plot_dir):
         os.makedirs(plot_dir)
 
 
-    # create benchmark object
-    b = Benchmark(data_dir+"/pdb/")
+    # reuse evaluation statistics from a previous run
+    statistics_file = None
+    if args.statistics_dir is not None:
+        if not os.path.exists(args.statistics_dir):
+            os.makedirs(args.statistics_dir)
+        statistics_file = args.statistics_dir + "/fig_1c" + statistics_io.default_extension()
 
+    if statistics_file is not None and os.path.exists(statistics_file):
+        print("Load evaluation statistics from {0}.".format(statistics_file))
+        b = Benchmark.from_evaluation_statistics(statistics_file, profile=args.profile_dir is not None)
+    else:
+        # create benchmark object
+        b = Benchmark(data_dir+"/pdb/", results_cache_dir=args.results_cache_dir, profile=args.profile_dir is not None)
 
-    #specify methods to benchmark
-    b.add_method("pseudo-likelihood APC", data_dir +"/predictions_pll/", "apc.mat")
-    b.add_method("pseudo-likelihood raw", data_dir +"/predictions_pll/", "raw.mat")
-    b.add_method("persistent contrastive divergence APC", data_dir +"/predictions_pcd/", "apc.mat")
-    b.add_method("persistent contrastive divergence raw", data_dir +"/predictions_pcd/", "raw.mat")
 
-    #add constraint that all MRF optimizations have exist status 0
-    b.add_constraint("opt_code", 0, "greater_equal")
+        #specify methods to benchmark
+        b.add_method("pseudo-likelihood APC", data_dir +"/predictions_pll/", "apc.mat", manifest=files)
+        b.add_method("pseudo-likelihood raw", data_dir +"/predictions_pll/", "raw.mat", manifest=files)
+        b.add_method("persistent contrastive divergence APC", data_dir +"/predictions_pcd/", "apc.mat", manifest=files)
+        b.add_method("persistent contrastive divergence raw", data_dir +"/predictions_pcd/", "raw.mat", manifest=files)
 
-    #compute the precision of predictions
-    b.compute_evaluation_statistics(seqsep=6, contact_thr=8, noncontact_thr=8)
+        #add constraint that all MRF optimizations have exist status 0
+        b.add_constraint("opt_code", 0, "greater_equal")
+
+        #compute the precision of predictions
+        b.compute_evaluation_statistics(seqsep=6, contact_thr=8, noncontact_thr=8, n_jobs=args.num_processes)
+
+        if statistics_file is not None:
+            print("Write evaluation statistics to {0}.".format(statistics_file))
+            b.export_evaluation_statistics(statistics_file)
 
     #generate a benchmark plot
     plot = b.plot_precision_vs_rank()
 
     #format that benchmark plot to resemble the one in Fig 1C
-    plot_pll_vs_pcd_benchmark_figure(plot, plot_dir, height=500, width=1000)
+    with b.profiler.timer("plot"):
+        plot_pll_vs_pcd_benchmark_figure(plot, plot_dir, height=500, width=1000)
+
+    if args.profile_dir is not None:
+        if not os.path.exists(args.profile_dir):
+            os.makedirs(args.profile_dir)
+        b.write_profile(args.profile_dir + "/fig_1c.profile.json")
 
 
 
@@ -9,10 +9,11 @@
 import argparse
 import sys
 import os
-import glob
 import plotly.graph_objs as go
 from plotly.offline import plot as plotly_plot
 import ccmpred.io.contactmatrix
+import matrix_io
+from manifest import file_index
 
 def parse_args():
     """
@@ -22,6 +23,9 @@ def parse_args():
 
     parser = argparse.ArgumentParser(description='Plot CCMgen paper Figure 1C.')
     parser.add_argument("data_dir", type=str, help="path to psicov data working directory")
+    parser.add_argument("--num-threads", type=int, default=8, help="number of threads for reading meta data")
+    parser.add_argument("--manifest", action="store_true", default=False,
+                        help="resolve files from the manifest of DATA_DIR (built if missing, refreshed incrementally)")
 
     args = parser.parse_args()
 
@@ -76,6 +80,7 @@ def main():
     plot_dir = data_dir + "/plots/"
     mat_dirs = [data_dir + "/predictions_pll/", data_dir + "/predictions_pcd/"]
     methods = ["pseudo-likelihood", "persistent<br>contrastive divergence"]
+    files = file_index(data_dir, args.manifest)
 
 
     if not os.path.exists(plot_dir):
@@ -86,14 +91,21 @@ def main():
     #prepare dictionary for plotting
     plot_data = {}
 
-    #iterate over all contact matrix files for all methods
+    #iterate over all contact matrix files for all methods (only meta data is read)
     for id, mat_dir in enumerate(mat_dirs):
-        mat_files = glob.glob(mat_dir + "/*.apc.mat")
+        mat_files = files.glob(mat_dir + "/*.apc.mat")
         plot_data[methods[id]] = []
 
+        # meta data stored in the manifest is not read again
+        meta_data = {}
         for mat_file in mat_files:
-            mat, meta = ccmpred.io.contactmatrix.read_matrix(mat_file)
-            runtime =ccmpred.io.contactmatrix.find_dict_key("runtime", meta)
+            entry = files.current_entry(mat_file)
+            if entry is not None and entry['meta'] is not None:
+                meta_data[mat_file] = entry['meta']
+        meta_data.update(matrix_io.read_matrix_meta_batch(
+            [mat_file for mat_file in mat_files if mat_file not in meta_data], num_threads=args.num_threads))
+        for mat_file in mat_files:
+            runtime =ccmpred.io.contactmatrix.find_dict_key("runtime", meta_data[mat_file])
             plot_data[methods[id]].append(runtime)
 
 
@@ -9,78 +9,48 @@
 ### load libraries ===============================================================================
 import argparse
 import os
-import glob
 import numpy as np
-import ccmpred.raw as raw
-from ccmpred import CCMpred
-from ccmpred.io import contactmatrix
 import plotly.graph_objs as go
 from plotly.offline import plot as plotly_plot
+from manifest import file_index
+from correction_terms import CorrectionTerms
+import scatter
 from scipy.stats import pearsonr
 
 
-def compute_correction_terms(alignment_file, binary_raw_file):
-
-    #initialise ccmpred object
-    ccm = CCMpred()
-
-    # specify possible file paths
-    ccm.set_alignment_file(alignment_file)
-    ccm.set_initraw_file(binary_raw_file)
-
-    # read alignment and remove gapped sequences and positions
-    ccm.read_alignment("psicov", 50, 75)
-
-    # compute sequence weights (in order to reduce sampling bias)
-    ccm.compute_sequence_weights("simple", 0.8)
-
-    # compute amino acid counts and frequencies adding pseudo counts for non-observed amino acids
-    ccm.compute_frequencies("uniform_pseudocounts", 1,  1)
-
-    #read in binary raw file
-    ccm.intialise_potentials()
-
-    #compute apc
-    ccm.recenter_potentials()
-    cmat = contactmatrix.frobenius_score(ccm.x_pair)
-    mean = np.mean(cmat, axis=0)
-    apc_mat = mean[:, np.newaxis] * mean[np.newaxis, :] / np.mean(cmat)
-
-    #compute entropy correction
-    single_freq = ccm.pseudocounts.freqs[0]
-    nr_states = 20
-    log = np.log2
-    scaling_factor, mat_corrected = contactmatrix.compute_local_correction(
-        single_freq, ccm.x_pair, ccm.neff, 1,
-        squared=False, entropy=True, nr_states=nr_states, log=log
-    )
-    entropy_correction_mat = cmat - mat_corrected
-
-    return apc_mat, entropy_correction_mat
-
-def plot_scatter(apc_mat, ec_mat, plot_file):
+def plot_scatter(apc_mat, ec_mat, plot_file, max_points=None):
 
     indices_i, indices_j = np.triu_indices(apc_mat.shape[0], k=1)
     apc = apc_mat[indices_i, indices_j]
     ec = ec_mat[indices_i, indices_j]
 
-    text = ["i: {0}<br>j: {1}<br>apc:{2}<br>ec:{3}".format(
-        i,j,apc_mat[i, j], ec_mat[i, j])
-        for i,j in zip(indices_i, indices_j)]
-
-
-    scatter_data = go.Scatter(
-            x = apc,
-            y = ec,
-            mode = 'markers',
-            marker = dict(color="black"),
-            text = text,
-            showlegend = False
+    if max_points is not None:
+        # compact mode: extreme pairs and a thinned out bulk with numeric residue indices
+        scatter_data = scatter.compact_pair_scatter(
+            apc, ec, indices_i, indices_j,
+            hover_labels=("apc", "ec"),
+            marker=dict(color="black"),
+            selected=scatter.downsample_scatter(apc, ec, max_points=max_points)
         )
-
+    else:
+        text = ["i: {0}<br>j: {1}<br>apc:{2}<br>ec:{3}".format(
+            i,j,apc_mat[i, j], ec_mat[i, j])
+            for i,j in zip(indices_i, indices_j)]
+
+
+        scatter_data = go.Scatter(
+                x = apc,
+                y = ec,
+                mode = 'markers',
+                marker = dict(color="black"),
+                text = text,
+                showlegend = False
+            )
+
+    max_value = max(np.max(apc), np.max(ec))
     diagonal = go.Scatter(
-        x=[0, np.max(list(apc) + list(ec))],
-        y=[0,np.max(list(apc) + list(ec))],
+        x=[0, max_value],
+        y=[0, max_value],
         mode="lines",
         line=dict(color="darkgrey", width=4, dash="dot"),
         showlegend=False
@@ -139,6 +109,10 @@ def parse_args():
 
     parser = argparse.ArgumentParser(description='Plot CCMgen paper Figure 1C.')
     parser.add_argument("data_dir", type=str, help="path to psicov data working directory")
+    parser.add_argument("--manifest", action="store_true", default=False,
+                        help="resolve files from the manifest of DATA_DIR (built if missing, refreshed incrementally)")
+    parser.add_argument("--max-points", type=int, default=None,
+                        help="compact scatter plots: keep extreme pairs and thin out the bulk to about MAX_POINTS points")
 
     args = parser.parse_args()
 
@@ -154,25 +128,27 @@ def main():
     pll_dir = data_dir + "/predictions_pll/"
     pcd_dir = data_dir + "/predictions_pcd/"
     alignment_dir = data_dir  + "/aln/"
+    files = file_index(data_dir, args.manifest)
     plot_dir = data_dir +  "/plots/apc_vs_ec/"
 
-    for alignment_file in glob.glob(alignment_dir + "/*aln"):
+    for alignment_file in files.glob(alignment_dir + "/*aln"):
 
         protein  = os.path.basename(alignment_file).split(".")[0]
 
-        #PLL
-        plot_file  = plot_dir + protein + ".apc_vs_ec.pll.html"
-        binary_raw_file = pll_dir + protein + ".braw.gz"
-        if os.path.exists(binary_raw_file):
-            apc, entropy = compute_correction_terms(alignment_file, binary_raw_file)
-            plot_scatter(apc, entropy, plot_file)
-
-        #PCD
-        plot_file  = plot_dir + protein + ".apc_vs_ec.pcd.html"
-        binary_raw_file = pcd_dir + protein + ".braw.gz"
-        if os.path.exists(binary_raw_file):
-            apc, entropy = compute_correction_terms(alignment_file, binary_raw_file)
-            plot_scatter(apc, entropy, plot_file)
+        #PLL and PCD model
+        models = [
+            (pll_dir + protein + ".braw.gz", plot_dir + protein + ".apc_vs_ec.pll.html"),
+            (pcd_dir + protein + ".braw.gz", plot_dir + protein + ".apc_vs_ec.pcd.html")
+        ]
+        models = [(binary_raw_file, plot_file) for binary_raw_file, plot_file in models if files.exists(binary_raw_file)]
+        if len(models) == 0:
+            continue
+
+        #the alignment is preprocessed only once for both models
+        correction_terms = CorrectionTerms(alignment_file)
+        for binary_raw_file, plot_file in models:
+            apc, entropy = correction_terms.compute(binary_raw_file)
+            plot_scatter(apc, entropy, plot_file, max_points=args.max_points)
 
 
 if __name__ == '__main__':
@@ -13,6 +13,9 @@ import argparse
 import os
 import numpy as np
 from benchmark import Benchmark
+from dataset import EvaluationDataset
+import statistics_io
+from manifest import file_index
 import copy
 from plotly.offline import plot as plotly_plot
 import plotly.graph_objs as go
@@ -118,6 +121,47 @@ def plot_ccmgen_noise_quant_figure(benchmark_plot_star, benchmark_plot_binary, p
 
     plotly_plot(fig, filename=plot_file, auto_open=False, show_link=False)
 
+def benchmark_topology(dataset, files, data_dir, topology, args, sequence_separation, contact_thr, non_contact_thr):
+
+    # reuse evaluation statistics from a previous run
+    statistics_file = None
+    if args.statistics_dir is not None:
+        if not os.path.exists(args.statistics_dir):
+            os.makedirs(args.statistics_dir)
+        statistics_file = args.statistics_dir + "/fig_6." + topology + statistics_io.default_extension()
+        if os.path.exists(statistics_file):
+            print("Load evaluation statistics from {0}.".format(statistics_file))
+            return Benchmark.from_evaluation_statistics(statistics_file, profile=args.profile_dir is not None)
+
+    # create benchmark object
+    b = Benchmark(dataset=dataset, results_cache_dir=args.results_cache_dir, profile=args.profile_dir is not None)
+
+    #specify methods to benchmark
+    b.add_method("APC", data_dir +"/recover_pcd_constrained/", "apc." + topology + ".mat", manifest=files)
+    b.add_method("EC", data_dir +"/recover_pcd_constrained/", "ec." + topology + ".mat", manifest=files)
+    b.add_method("no APC", data_dir + "/recover_pcd_constrained/", "raw." + topology + ".mat", manifest=files)
+
+    #add constraint that all MRF optimizations have exist status 0
+    b.add_constraint("opt_code", 0, "greater_equal")
+
+    #compute the precision of predictions
+    b.compute_evaluation_statistics(seqsep=sequence_separation, contact_thr=contact_thr, noncontact_thr=non_contact_thr, n_jobs=args.num_processes)
+
+    if statistics_file is not None:
+        print("Write evaluation statistics to {0}.".format(statistics_file))
+        b.export_evaluation_statistics(statistics_file)
+
+    return b
+
+def write_profile(b, args, topology):
+
+    if args.profile_dir is None:
+        return
+
+    if not os.path.exists(args.profile_dir):
+        os.makedirs(args.profile_dir)
+    b.write_profile(args.profile_dir + "/fig_6." + topology + ".profile.json")
+
 def parse_args():
     """
     parse command line arguments
@@ -126,6 +170,15 @@ def parse_args():
 
     parser = argparse.ArgumentParser(description='Plot CCMgen paper Figure 1C.')
     parser.add_argument("data_dir", type=str, help="path to psicov data working directory")
+    parser.add_argument("--num-processes", type=int, default=1, help="number of processes used to evaluate proteins")
+    parser.add_argument("--results-cache-dir", type=str, default=None,
+                        help="reuse evaluation metrics of unchanged predictions stored in this directory")
+    parser.add_argument("--statistics-dir", type=str, default=None,
+                        help="load evaluation statistics from this directory if available, otherwise write them there")
+    parser.add_argument("--profile-dir", type=str, default=None,
+                        help="write timings per stage, protein and method of the benchmark runs to this directory")
+    parser.add_argument("--manifest", action="store_true", default=False,
+                        help="resolve files from the manifest of DATA_DIR (built if missing, refreshed incrementally)")
 
     args = parser.parse_args()
 
@@ -150,26 +203,20 @@ def main():
 
 
 
-    ### create benchmark plot for star-tree topologies
+    # protein structures are shared by the benchmarks for both topologies
+    dataset = EvaluationDataset(pdb_dir)
+    files = file_index(data_dir, args.manifest)
 
-    # create benchmark object
-    b = Benchmark(pdb_dir)
-
-    #specify methods to benchmark
-    b.add_method("APC", data_dir +"/recover_pcd_constrained/", "apc.star.mat")
-    b.add_method("EC", data_dir +"/recover_pcd_constrained/", "ec.star.mat")
-    b.add_method("no APC", data_dir + "/recover_pcd_constrained/", "raw.star.mat")
-
-    #add constraint that all MRF optimizations have exist status 0
-    b.add_constraint("opt_code", 0, "greater_equal")
-
-    #compute the precision of predictions
-    b.compute_evaluation_statistics(seqsep=sequence_separation, contact_thr=contact_thr, noncontact_thr=non_contact_thr)
+    ### create benchmark plot for star-tree topologies
+    b = benchmark_topology(dataset, files, data_dir, "star", args,
+                           sequence_separation, contact_thr, non_contact_thr)
 
     #generate a benchmark plot
     benchmark_plot_star = b.plot_precision_vs_rank()
     plot_file = plot_dir+"/"+"fig_6b.html"
-    plot_ccmgen_benchmark_figure(benchmark_plot_star, 'star topology', plot_file, height=350, width=500)
+    with b.profiler.timer("plot"):
+        plot_ccmgen_benchmark_figure(benchmark_plot_star, 'star topology', plot_file, height=350, width=500)
+    write_profile(b, args, "star")
 
 
 
@@ -177,26 +224,15 @@ def main():
 
 
     ### create benchmark plot for binary-tree topologies
-
-    # create benchmark object
-    b = Benchmark(pdb_dir)
-
-    # specify methods to benchmark
-    b.add_method("APC", data_dir + "/recover_pcd_constrained/", "apc.binary.mat")
-    b.add_method("EC", data_dir + "/recover_pcd_constrained/", "ec.binary.mat")
-    b.add_method("no APC", data_dir + "/recover_pcd_constrained/", "raw.binary.mat")
-
-
-    # add constraint that all MRF optimizations have exist status 0
-    b.add_constraint("opt_code", 0, "greater_equal")
-
-    # compute the precision of predictions
-    b.compute_evaluation_statistics(seqsep=sequence_separation, contact_thr=contact_thr, noncontact_thr=non_contact_thr)
+    b = benchmark_topology(dataset, files, data_dir, "binary", args,
+                           sequence_separation, contact_thr, non_contact_thr)
 
     # generate a benchmark plot
     benchmark_plot_binary = b.plot_precision_vs_rank()
     plot_file = plot_dir+"/"+"fig_6a.html"
-    plot_ccmgen_benchmark_figure(benchmark_plot_binary, 'binary topology', plot_file, height=350, width=500)
+    with b.profiler.timer("plot"):
+        plot_ccmgen_benchmark_figure(benchmark_plot_binary, 'binary topology', plot_file, height=350, width=500)
+    write_profile(b, args, "binary")
 
 
 
@@ -12,14 +12,14 @@
 import argparse
 import sys
 import os
-import glob
 import numpy as np
-from scipy.stats import pearsonr
 
-import ccmpred.io.alignment
 import ccmpred.gaps
-import ccmpred.pseudocounts
-import ccmpred.weighting
+import alignment_io
+from correlation import RunningPearson
+from frequency_counts import frequency_blocks
+from frequency_cache import FrequencyCache, compute_weights
+from manifest import file_index
 
 import plotly.graph_objs as go
 from plotly.offline import plot as plotly_plot
@@ -67,23 +67,73 @@ def plot_boxplot_correlation_alignment_statistics_pll_vs_pcd(data_dict, plot_fil
 
     plotly_plot(fig, filename=plot_file, auto_open=False, show_link=False)
 
-def get_freq(alignment):
+def get_freq(alignment, frequency_cache=None, num_threads=1, block_size=32):
 
-    # compute sequence weights for observed sequences
-    weights = ccmpred.weighting.weights_simple(alignment, 0.8)
+    # tiles of degapped amino acid frequencies (weights: simple, 0.8; uniform pseudocounts)
+    if frequency_cache is not None:
+        return frequency_cache.blocks(alignment)
 
-    # compute observed amino acid frequencies
-    pseudocounts = ccmpred.pseudocounts.PseudoCounts(alignment, weights)
-    pseudocounts.calculate_frequencies(
-        'uniform_pseudocounts', 1, 1, remove_gaps=False
-    )
-    single_freq, pairwise_freq = pseudocounts.freqs
+    weights = compute_weights(alignment, num_threads=num_threads)
+    return frequency_blocks(alignment, weights, block_size)
+
+def get_covariance(single_freq, pairwise_freq, indices_i, indices_j):
+    """
+    Covariances f(i,j,a,b) - f(i,a) * f(j,b) of residue pairs (i,j) and amino acids (a,b)
+
+    :param single_freq: C x 20 single site frequencies
+    :param pairwise_freq: P x 20 x 20 pairwise frequencies of the residue pairs
+    :param indices_i: residue indices i of pairs (into single_freq)
+    :param indices_j: residue indices j of pairs (into single_freq)
+    :return: flat vector of covariances, ordered by pair, then a, then b
+    """
+
+    covariance = pairwise_freq - \
+                 single_freq[indices_i, :, np.newaxis] * single_freq[indices_j, np.newaxis, :]
+
+    return covariance.flatten()
+
+def correlate_alignment_statistics(L, blocks, sampled_blocks):
+    """
+    Pearson correlation of single site frequencies, pairwise frequencies and covariances
+    between the original and sampled alignments
+
+    Frequencies are consumed one tile of two blocks of residues at a time
+    (frequency_counts.frequency_blocks), so memory is bounded by the block size and not by L.
 
-    # degap the frequencies (ignore gap frequencies)
-    single_freq = pseudocounts.degap(single_freq, False)
-    pairwise_freq = pseudocounts.degap(pairwise_freq, False)
+    :param L: number of residues
+    :param blocks: tiles of frequencies of the original alignment
+    :param sampled_blocks: dictionary mapping a method to the tiles of frequencies of its sampled alignment
+                           (same block size)
+    :return: dictionary mapping a method to the pearson r of 'single', 'pair' and 'covariance'
+    """
 
-    return single_freq, pairwise_freq
+    methods = list(sampled_blocks.keys())
+
+    single_freq = np.zeros((L, 20))
+    single_freq_sampled = {method: np.zeros((L, 20)) for method in methods}
+    pair = {method: RunningPearson() for method in methods}
+    covariance = {method: RunningPearson() for method in methods}
+
+    # tiles are generated in the same order for all alignments
+    tiles = zip(blocks, *[sampled_blocks[method] for method in methods])
+    for (columns, single, indices_i, indices_j, pairwise), *tiles_sampled in tiles:
+        single_freq[columns] = single
+        covariance_original = get_covariance(single, pairwise, indices_i, indices_j)
+
+        for method, (_, single_sampled, _, _, pairwise_sampled) in zip(methods, tiles_sampled):
+            single_freq_sampled[method][columns] = single_sampled
+            pair[method].update(pairwise, pairwise_sampled)
+            covariance[method].update(
+                covariance_original, get_covariance(single_sampled, pairwise_sampled, indices_i, indices_j))
+
+    return {
+        method: {
+            'single': np.corrcoef(single_freq.flatten(), single_freq_sampled[method].flatten())[0, 1],
+            'pair': pair[method].correlation(),
+            'covariance': covariance[method].correlation()
+        }
+        for method in methods
+    }
 
 def parse_args():
     """
@@ -93,6 +143,13 @@ def parse_args():
 
     parser = argparse.ArgumentParser(description='Plot CCMgen paper Figure 1C.')
     parser.add_argument("data_dir", type=str, help="path to psicov data working directory")
+    parser.add_argument("--manifest", action="store_true", default=False,
+                        help="resolve files from the manifest of DATA_DIR (built if missing, refreshed incrementally)")
+    parser.add_argument("--frequency-cache-dir", type=str, default=None,
+                        help="cache sequence weights and amino acid frequencies of alignments in this directory")
+    parser.add_argument("--num-threads", type=int, default=1, help="number of threads computing sequence weights")
+    parser.add_argument("--block-size", type=int, default=32,
+                        help="number of residues per block when computing pairwise statistics (bounds memory)")
 
     args = parser.parse_args()
 
@@ -110,6 +167,12 @@ def main():
     samples_pll_dir = data_dir + "/samples_pll/"
     samples_pcd_dir = data_dir + "/samples_pcd/"
     max_gap_pos = 50
+    files = file_index(data_dir, args.manifest)
+
+    frequency_cache = None
+    if args.frequency_cache_dir is not None:
+        frequency_cache = FrequencyCache(args.frequency_cache_dir, block_size=args.block_size,
+                                         num_threads=args.num_threads)
 
     if not os.path.exists(samples_pll_dir) or not os.path.exists(samples_pcd_dir):
         print("You first need to generate MCMC samples from Markov Random Field models in {0} and {1}".format(
@@ -132,22 +195,23 @@ def main():
     }
 
 
-    for alignment_file in glob.glob(alignment_dir + "/*aln"):
+    for alignment_file in files.glob(alignment_dir + "/*aln"):
 
         protein  = os.path.basename(alignment_file).split(".")[0]
 
         sampled_pll = samples_pll_dir + "/" + protein + ".mcmc.aln"
         sampled_pcd = samples_pcd_dir + "/" + protein + ".mcmc.aln"
 
-        if not os.path.exists(sampled_pll) or not os.path.exists(sampled_pcd):
+        if not files.exists(sampled_pll) or not files.exists(sampled_pcd):
             continue
 
         print("compute correlation of alignment statistics for {0}...".format(protein))
 
         #read alignment files
-        alignment = ccmpred.io.alignment.read_msa_psicov(alignment_file)
-        alignment_sampled_pll = ccmpred.io.alignment.read_msa_psicov(sampled_pll)
-        alignment_sampled_pcd = ccmpred.io.alignment.read_msa_psicov(sampled_pcd)
+        #(binary copies written by alignment_io.py are memory-mapped instead)
+        alignment = alignment_io.read_alignment(alignment_file)
+        alignment_sampled_pll = alignment_io.read_alignment(sampled_pll)
+        alignment_sampled_pcd = alignment_io.read_alignment(sampled_pcd)
 
         #remove gappy positions
         alignment, gapped_positions = ccmpred.gaps.remove_gapped_positions(alignment, max_gap_pos)
@@ -155,50 +219,26 @@ def main():
         alignment_sampled_pll = np.ascontiguousarray(alignment_sampled_pll[:, non_gapped_positions])
         alignment_sampled_pcd = np.ascontiguousarray(alignment_sampled_pcd[:, non_gapped_positions])
 
-        #get amino acid frequencies
-        freq_single, freq_pair = get_freq(alignment)
-        freq_single_pll, freq_pair_pll = get_freq(alignment_sampled_pll)
-        freq_single_pcd, freq_pair_pcd = get_freq(alignment_sampled_pcd)
-
-
-        #reshape and compute covariances
-        L = alignment.shape[1]
-        indices_i, indices_j = np.triu_indices(L, k=1)
-
-        single = freq_single.flatten().tolist()
-        single_pll = freq_single_pll.flatten().tolist()
-        single_pcd = freq_single_pcd.flatten().tolist()
-
-        pair = freq_pair[indices_i, indices_j, :, :].flatten().tolist()
-        pair_pll = freq_pair_pll[indices_i, indices_j, :, :].flatten().tolist()
-        pair_pcd = freq_pair_pcd[indices_i, indices_j, :, :].flatten().tolist()
-
-        cov = [freq_pair[i, j, a, b] - (freq_single[i, a] * freq_single[j, b])
-                        for i in range(L - 1) for j in range(i + 1, L) for a in range(20) for b in range(20)]
-        cov_pll = [freq_pair_pll[i, j, a, b] - (freq_single_pll[i, a] * freq_single_pll[j, b])
-                        for i in range(L - 1) for j in range(i + 1, L) for a in range(20) for b in range(20)]
-        cov_pcd = [freq_pair_pcd[i, j, a, b] - (freq_single_pcd[i, a] * freq_single_pcd[j, b])
-                        for i in range(L - 1) for j in range(i + 1, L) for a in range(20) for b in range(20)]
-
+        #get amino acid frequencies (one tile of residue blocks at a time)
+        freq = get_freq(alignment, frequency_cache, args.num_threads, args.block_size)
+        freq_pll = get_freq(alignment_sampled_pll, frequency_cache, args.num_threads, args.block_size)
+        freq_pcd = get_freq(alignment_sampled_pcd, frequency_cache, args.num_threads, args.block_size)
 
-        #compute pearson correlation
-        data_dict['pseudo-likelihood']['x'].append(np.corrcoef(single, single_pll)[0, 1])
-        data_dict['pseudo-likelihood']['y'].append('single site amino<br>acid frequencies')
 
-        data_dict['pseudo-likelihood']['x'].append(np.corrcoef(pair, pair_pll)[0, 1])
-        data_dict['pseudo-likelihood']['y'].append('pairwise amino<br>acid frequencies')
+        #compute pearson correlation of alignment statistics in blocks of residues
+        correlations = correlate_alignment_statistics(
+            alignment.shape[1], freq, {'pseudo-likelihood': freq_pll, 'contrastive divergence': freq_pcd})
 
-        data_dict['pseudo-likelihood']['x'].append(np.corrcoef(cov, cov_pll)[0, 1])
-        data_dict['pseudo-likelihood']['y'].append('Covariances')
+        for method in ['pseudo-likelihood', 'contrastive divergence']:
 
-        data_dict['contrastive divergence']['x'].append(np.corrcoef(single, single_pcd)[0, 1])
-        data_dict['contrastive divergence']['y'].append('single site amino<br>acid frequencies')
+            data_dict[method]['x'].append(correlations[method]['single'])
+            data_dict[method]['y'].append('single site amino<br>acid frequencies')
 
-        data_dict['contrastive divergence']['x'].append(np.corrcoef(pair, pair_pcd)[0, 1])
-        data_dict['contrastive divergence']['y'].append('pairwise amino<br>acid frequencies')
+            data_dict[method]['x'].append(correlations[method]['pair'])
+            data_dict[method]['y'].append('pairwise amino<br>acid frequencies')
 
-        data_dict['contrastive divergence']['x'].append(np.corrcoef(cov, cov_pcd)[0, 1])
-        data_dict['contrastive divergence']['y'].append('Covariances')
+            data_dict[method]['x'].append(correlations[method]['covariance'])
+            data_dict[method]['y'].append('Covariances')
 
 
 
@@ -13,15 +13,18 @@
 ### load libraries
 import argparse
 import os
+from concurrent.futures import ProcessPoolExecutor
 from plotly.offline import plot as plotly_plot
 import plotly.graph_objs as go
-import glob
-from ccmpred.io import contactmatrix
+import matrix_io
+from manifest import file_index
 import numpy as np
-from scipy.stats import ks_2samp, spearmanr, kendalltau, pearsonr, linregress
+from scipy.stats import linregress
 import pandas as pd
+import scatter
+from correlation import correlation_statistics
 
-def plot_scatter_comparison(mat_pll, mat_pcd, plot_file, qqplot=False):
+def plot_scatter_comparison(mat_pll, mat_pcd, plot_file, qqplot=False, max_points=None):
 
     L = mat_pll.shape[0]
     indices_i, indices_j = np.triu_indices(L, k=1)
@@ -38,10 +41,6 @@ def plot_scatter_comparison(mat_pll, mat_pcd, plot_file, qqplot=False):
     slope, intercept, rvalue, pvalue, stderr = linregress(score_pcd, score_pll)
     lin_reg_y = [intercept + slope * x for x in lin_reg_x]
 
-    #hover text in interactive html file
-    text = ["i: " + str(i+1) + "<br>j: " + str(j+1) for i,j in zip(indices_i, indices_j)]
-
-
     data=[]
 
     #plot diagonal at bottom
@@ -59,44 +58,66 @@ def plot_scatter_comparison(mat_pll, mat_pcd, plot_file, qqplot=False):
     )
 
     # plot scatter in blue
-    data.append(
-        go.Scattergl(
-            x= score_pcd,
-            y= score_pll,
-            text = text,
-            mode = 'markers',
-            marker=dict(
-                opacity=1,
-                color="rgb(31,120,180)"
-            ),
-            hoverinfo="x+y+text",
-            showlegend=False
-        )
-    )
-
-    # QQ Plot will be printed on top in orange
-    if qqplot:
-        index_sorted_i = np.argsort(score_pll)
-        index_sorted_j = np.argsort(score_pcd)
-
-        text_sorted = ["i: " + str(i + 1) + "<br>j: " + str(j + 1) for i, j in zip(
-            indices_i[index_sorted_i],
-            indices_j[index_sorted_j]
-        )]
+    if max_points is not None:
+        # compact mode: extreme pairs and a thinned out bulk with numeric residue indices
+        data.append(scatter.compact_pair_scatter(
+            score_pcd, score_pll, indices_i, indices_j,
+            hover_labels=("pcd", "pll"),
+            marker=dict(opacity=1, color="rgb(31,120,180)"),
+            selected=scatter.downsample_scatter(score_pcd, score_pll, max_points=max_points)
+        ))
+    else:
+        #hover text in interactive html file
+        text = ["i: " + str(i+1) + "<br>j: " + str(j+1) for i,j in zip(indices_i, indices_j)]
 
         data.append(
             go.Scattergl(
-                x=sorted(score_pcd),
-                y=sorted(score_pll),
-                text=text_sorted,
-                mode='markers',
+                x= score_pcd,
+                y= score_pll,
+                text = text,
+                mode = 'markers',
                 marker=dict(
-                    color="rgb(255,127,0)"),
+                    opacity=1,
+                    color="rgb(31,120,180)"
+                ),
                 hoverinfo="x+y+text",
                 showlegend=False
             )
         )
 
+    # QQ Plot will be printed on top in orange
+    if qqplot:
+        index_sorted_i = np.argsort(score_pll)
+        index_sorted_j = np.argsort(score_pcd)
+
+        if max_points is not None:
+            # compact mode: both tails and evenly spaced quantiles
+            data.append(scatter.compact_pair_scatter(
+                score_pcd[index_sorted_j], score_pll[index_sorted_i],
+                indices_i[index_sorted_i], indices_j[index_sorted_j],
+                hover_labels=("pcd", "pll"),
+                marker=dict(color="rgb(255,127,0)"),
+                selected=scatter.downsample_curve(len(score_pll), max_points=max_points)
+            ))
+        else:
+            text_sorted = ["i: " + str(i + 1) + "<br>j: " + str(j + 1) for i, j in zip(
+                indices_i[index_sorted_i],
+                indices_j[index_sorted_j]
+            )]
+
+            data.append(
+                go.Scattergl(
+                    x=sorted(score_pcd),
+                    y=sorted(score_pll),
+                    text=text_sorted,
+                    mode='markers',
+                    marker=dict(
+                        color="rgb(255,127,0)"),
+                    hoverinfo="x+y+text",
+                    showlegend=False
+                )
+            )
+
     # plot linear regression fit as black line
     data.append(
         go.Scatter(
@@ -207,6 +228,27 @@ def plot_boxplot_correlation(stats_dict, keys_list, plot_file):
     plotly_plot(plot, filename=plot_file, auto_open=False, show_link=False)
 
 
+def compute_protein_statistics(protein, mat_file_pll, mat_file_pcd, plot_file=None, max_points=None):
+    """
+    Scatter plot (optional) and correlation statistics of the APC corrected scores of one protein
+
+    :return: protein, dictionary of correlation statistics
+    """
+
+    #read contact matrices (corrected with APC)
+    mat_pll, meta_pll = matrix_io.read_matrix(mat_file_pll)
+    mat_pcd, meta_pcd = matrix_io.read_matrix(mat_file_pcd)
+
+    if plot_file is not None:
+        plot_scatter_comparison(mat_pll, mat_pcd, plot_file, qqplot=True, max_points=max_points)
+
+    #compute correlation statistics
+    L = mat_pll.shape[0]
+    scores_pll = mat_pll[np.triu_indices(L, k=1)]
+    scores_pcd = mat_pcd[np.triu_indices(L, k=1)]
+
+    return protein, correlation_statistics(scores_pcd, scores_pll)
+
 def parse_args():
     """
     parse command line arguments
@@ -215,6 +257,13 @@ def parse_args():
 
     parser = argparse.ArgumentParser(description='Plot CCMgen paper Figure 1C.')
     parser.add_argument("data_dir", type=str, help="path to psicov data working directory")
+    parser.add_argument("--manifest", action="store_true", default=False,
+                        help="resolve files from the manifest of DATA_DIR (built if missing, refreshed incrementally)")
+    parser.add_argument("--max-points", type=int, default=None,
+                        help="compact scatter plots: keep extreme pairs and thin out the bulk to about MAX_POINTS points")
+    parser.add_argument("--no-scatter-plots", action="store_true", default=False,
+                        help="only compute the correlation statistics for Figure S3b")
+    parser.add_argument("--num-processes", type=int, default=1, help="number of processes used to evaluate proteins")
 
     args = parser.parse_args()
 
@@ -229,6 +278,7 @@ def main():
     plot_dir = data_dir+"/plots/supplement/"
     pll_dir = data_dir+"/predictions_pll/"
     pcd_dir = data_dir + "/predictions_pcd/"
+    files = file_index(data_dir, args.manifest)
 
     if not os.path.exists(plot_dir):
         os.makedirs(plot_dir)
@@ -237,35 +287,28 @@ def main():
         os.makedirs(plot_dir + "/pll_vs_pcd_apc_score_comparison/")
 
 
-    stats_dict={}
-    for mat_file_pll in glob.glob(pll_dir + "/*.apc.mat"):
+    jobs = []
+    for mat_file_pll in files.glob(pll_dir + "/*.apc.mat"):
 
         protein = os.path.basename(mat_file_pll).split(".")[0]
         mat_file_pcd = pcd_dir + "/" + protein + ".apc.mat"
 
-        if not os.path.exists(mat_file_pcd):
+        if not files.exists(mat_file_pcd):
             continue
 
-        print("Computing statistics for protein {0}...".format(protein))
-
-        #read contact matrices (corrected with APC)
-        mat_pll, meta_pll = contactmatrix.read_matrix(mat_file_pll)
-        mat_pcd, meta_pcd = contactmatrix.read_matrix(mat_file_pcd)
-
-        plot_file = plot_dir +  '/pll_vs_pcd_apc_score_comparison/'  + protein  + "_scatter_pll_vs_pcd.html"
-        plot_scatter_comparison(mat_pll, mat_pcd, plot_file, qqplot=True)
-
-        #compute correlation statistics
-        L = mat_pll.shape[0]
-        scores_pll = mat_pll[np.triu_indices(L, k=1)]
-        scores_pcd = mat_pcd[np.triu_indices(L, k=1)]
-        stats_dict[protein] = {
-            "pearson": pearsonr(scores_pcd, scores_pll),
-            "kolmogorov-smirnov":  ks_2samp(scores_pcd, scores_pll),
-            "spearmanrho": spearmanr(scores_pcd, scores_pll),
-            "kendalltau": kendalltau(scores_pcd, scores_pll),
-            "linreg": linregress(scores_pcd, scores_pll)
-        }
+        plot_file = None
+        if not args.no_scatter_plots:
+            plot_file = plot_dir +  '/pll_vs_pcd_apc_score_comparison/'  + protein  + "_scatter_pll_vs_pcd.html"
+        jobs.append((protein, mat_file_pll, mat_file_pcd, plot_file, args.max_points))
+
+    #proteins are evaluated in parallel processes
+    stats_dict={}
+    with ProcessPoolExecutor(max_workers=args.num_processes) as executor:
+        futures = [executor.submit(compute_protein_statistics, *job) for job in jobs]
+        for future in futures:
+            protein, protein_stats = future.result()
+            print("Computed statistics for protein {0}...".format(protein))
+            stats_dict[protein] = protein_stats
 
     plot_file = plot_dir +  '/'  + "fig_S3b.html"
     plot_boxplot_correlation(stats_dict, ["Pearson r", "Spearman rho", "Kendalls tau", "linear fit slope"], plot_file)
@@ -10,55 +10,14 @@
 ### load libraries ===============================================================================
 import argparse
 import os
-import glob
 import numpy as np
-import ccmpred.raw as raw
-from ccmpred import CCMpred
-from ccmpred.io import contactmatrix
 import plotly.graph_objs as go
 from plotly.offline import plot as plotly_plot
+from manifest import file_index
+from correction_terms import CorrectionTerms
 from scipy.stats import pearsonr
 import sys
 
-def compute_correction_terms(alignment_file, binary_raw_file):
-
-    #initialise ccmpred object
-    ccm = CCMpred()
-
-    # specify possible file paths
-    ccm.set_alignment_file(alignment_file)
-    ccm.set_initraw_file(binary_raw_file)
-
-    # read alignment and remove gapped sequences and positions
-    ccm.read_alignment("psicov", 50, 75)
-
-    # compute sequence weights (in order to reduce sampling bias)
-    ccm.compute_sequence_weights("simple", 0.8)
-
-    # compute amino acid counts and frequencies adding pseudo counts for non-observed amino acids
-    ccm.compute_frequencies("uniform_pseudocounts", 1,  1)
-
-    #read in binary raw file
-    ccm.intialise_potentials()
-
-    #compute apc
-    ccm.recenter_potentials()
-    cmat = contactmatrix.frobenius_score(ccm.x_pair)
-    mean = np.mean(cmat, axis=0)
-    apc_mat = mean[:, np.newaxis] * mean[np.newaxis, :] / np.mean(cmat)
-
-    #compute entropy correction
-    single_freq = ccm.pseudocounts.freqs[0]
-    nr_states = 20
-    log = np.log2
-    scaling_factor, mat_corrected = contactmatrix.compute_local_correction(
-        single_freq, ccm.x_pair, ccm.neff, 1,
-        squared=False, entropy=True, nr_states=nr_states, log=log
-    )
-    entropy_correction_mat = cmat - mat_corrected
-
-    return apc_mat, entropy_correction_mat
-
 def plot_boxplot_correlation(pearson_r_pll, pearson_r_pcd, plot_file):
 
 
@@ -101,6 +60,8 @@ def parse_args():
 
     parser = argparse.ArgumentParser(description='Plot CCMgen paper Figure 1C.')
     parser.add_argument("data_dir", type=str, help="path to psicov data working directory")
+    parser.add_argument("--manifest", action="store_true", default=False,
+                        help="resolve files from the manifest of DATA_DIR (built if missing, refreshed incrementally)")
 
     args = parser.parse_args()
 
@@ -116,6 +77,7 @@ def main():
     pll_dir = data_dir + "/predictions_pll/"
     pcd_dir = data_dir + "/predictions_pcd/"
     alignment_dir = data_dir  + "/aln/"
+    files = file_index(data_dir, args.manifest)
     plot_dir = data_dir + "/plots/supplement/"
 
     if not os.path.exists(plot_dir):
@@ -129,34 +91,33 @@ def main():
 
     pearson_r_list_pll = []
     pearson_r_list_pcd = []
-    for alignment_file in glob.glob(alignment_dir + "/*aln"):
+    for alignment_file in files.glob(alignment_dir + "/*aln"):
 
         protein  = os.path.basename(alignment_file).split(".")[0]
 
-        #PLL
-        binary_raw_file = pll_dir + protein + ".braw.gz"
-        if os.path.exists(binary_raw_file):
-
-            try:
-                apc, entropy = compute_correction_terms(alignment_file, binary_raw_file)
-                indices_i, indices_j = np.triu_indices(apc.shape[0], k=1)
-                # compute pearson correlation coefficient
-                pearson_r_list_pll.append(
-                    pearsonr(apc[indices_i, indices_j], entropy[indices_i, indices_j])[0])
-            except:
-                print("Unexpected error:", sys.exc_info()[0])
-
-
-
-        #PCD
-        binary_raw_file = pcd_dir + protein + ".braw.gz"
-        if os.path.exists(binary_raw_file):
+        #PLL and PCD model
+        models = [
+            (pll_dir + protein + ".braw.gz", pearson_r_list_pll),
+            (pcd_dir + protein + ".braw.gz", pearson_r_list_pcd)
+        ]
+        models = [(binary_raw_file, pearson_r_list) for binary_raw_file, pearson_r_list in models if files.exists(binary_raw_file)]
+        if len(models) == 0:
+            continue
+
+        #the alignment is preprocessed only once for both models
+        try:
+            correction_terms = CorrectionTerms(alignment_file)
+        except:
+            print("Unexpected error:", sys.exc_info()[0])
+            continue
+
+        for binary_raw_file, pearson_r_list in models:
             try:
-                apc, entropy = compute_correction_terms(alignment_file, binary_raw_file)
+                apc, entropy = correction_terms.compute(binary_raw_file)
                 indices_i, indices_j = np.triu_indices(apc.shape[0], k=1)
 
                 # compute pearson correlation coefficient
-                pearson_r_list_pcd.append(
+                pearson_r_list.append(
                     pearsonr(apc[indices_i, indices_j], entropy[indices_i, indices_j])[0])
             except:
                 print("Unexpected error:", sys.exc_info()[0])
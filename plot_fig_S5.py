@@ -15,7 +15,7 @@ from benchmark import Benchmark
 import copy
 from plotly.offline import plot as plotly_plot
 import plotly.graph_objs as go
-import glob
+from manifest import file_index
 
 def plot_boxplot(statistics_dict, property, plot_file):
 
@@ -78,6 +78,8 @@ def parse_args():
 
     parser = argparse.ArgumentParser(description='Plot CCMgen paper Figure 1C.')
     parser.add_argument("data_dir", type=str, help="path to psicov data working directory")
+    parser.add_argument("--manifest", action="store_true", default=False,
+                        help="resolve files from the manifest of DATA_DIR (built if missing, refreshed incrementally)")
 
     args = parser.parse_args()
 
@@ -91,6 +93,7 @@ def main():
     data_dir = args.data_dir
     plot_dir = data_dir+"/plots/supplement/"
     sampled_aln = data_dir+"/samples_pcd_constrained/"
+    files = file_index(data_dir, args.manifest)
 
     if not os.path.exists(plot_dir):
         os.makedirs(plot_dir)
@@ -113,7 +116,7 @@ def main():
         }
     }
 
-    log_files = glob.glob(sampled_aln + "/*.log")
+    log_files = files.glob(sampled_aln + "/*.log")
     for log_file in log_files:
 
         topology = os.path.basename(log_file).split(".")[-2]
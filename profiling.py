@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+###     Opt-in timers and counters for benchmark runs
+###     Records the time spent per stage (reading matrices, distance maps,
+###     ranking, plotting, ...) per protein and method, reports total, mean and
+###     95th percentile per stage and writes all records to a JSON file.
+# ===============================================================================
+
+### load libraries
+from collections import Counter
+from contextlib import contextmanager
+import json
+import sys
+import time
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_memory_mb():
+    """
+    Peak resident memory of this process and of its terminated child processes
+
+    :return: dictionary with peak memory in MB
+    """
+
+    if resource is None:
+        return {}
+
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    unit = 1024.0**2 if sys.platform == "darwin" else 1024.0
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit,
+        'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit
+    }
+
+
+class Profiler():
+    """
+    Collects timings per stage, protein and method
+
+    A disabled profiler does not record anything, so timers can stay in place.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.records = []
+        self.counters = Counter()
+
+    @contextmanager
+    def timer(self, stage, protein=None, method=None):
+
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.records.append({
+                'stage': stage,
+                'protein': protein,
+                'method': method,
+                'seconds': time.perf_counter() - start
+            })
+
+    def count(self, name, value=1):
+        if self.enabled:
+            self.counters[name] += value
+
+    def merge(self, records, counters=None):
+        """
+        Add records and counters collected by another profiler (e.g. in a worker process)
+        """
+
+        if not self.enabled:
+            return
+
+        self.records.extend(records)
+        if counters is not None:
+            self.counters.update(counters)
+
+    def reset(self):
+        self.records = []
+        self.counters = Counter()
+
+    def stage_statistics(self):
+
+        seconds_per_stage = {}
+        for record in self.records:
+            seconds_per_stage.setdefault(record['stage'], []).append(record['seconds'])
+
+        statistics = {}
+        for stage, seconds in seconds_per_stage.items():
+            statistics[stage] = {
+                'count': len(seconds),
+                'total': float(np.sum(seconds)),
+                'mean': float(np.mean(seconds)),
+                'p95': float(np.percentile(seconds, 95))
+            }
+
+        return statistics
+
+    def seconds_per(self, key, stage=None):
+
+        seconds = Counter()
+        for record in self.records:
+            if record[key] is not None and (stage is None or record['stage'] == stage):
+                seconds[record[key]] += record['seconds']
+
+        return seconds
+
+    def print_summary(self, nr_slowest=10):
+
+        if not self.enabled:
+            return
+
+        print("\nProfile of benchmark run:")
+        print("{0:<20} {1:>8} {2:>12} {3:>12} {4:>12}".format("stage", "count", "total [s]", "mean [s]", "p95 [s]"))
+        for stage, stats in sorted(self.stage_statistics().items(), key=lambda item: -item[1]['total']):
+            print("{0:<20} {1:>8} {2:>12.3f} {3:>12.4f} {4:>12.4f}".format(
+                stage, stats['count'], stats['total'], stats['mean'], stats['p95']))
+
+        print("\nSlowest proteins:")
+        for protein, seconds in self.seconds_per('protein', stage='protein').most_common(nr_slowest):
+            print("{0:<20} {1:>12.3f} s".format(protein, seconds))
+
+        if len(self.counters) > 0:
+            print("\nCounters:")
+            for name, value in sorted(self.counters.items()):
+                print("{0:<20} {1:>12}".format(name, value))
+
+        memory = peak_memory_mb()
+        if len(memory) > 0:
+            print("\nPeak memory: {0:.1f} MB (worker processes: {1:.1f} MB)".format(memory['self'], memory['children']))
+
+    def write_json(self, json_file):
+        """
+        Write stage statistics, time per protein and method, counters, peak memory and all records
+
+        :param json_file: path to output file
+        :return:
+        """
+
+        profile = {
+            'created': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'stages': self.stage_statistics(),
+            'proteins': dict(self.seconds_per('protein', stage='protein')),
+            'methods': dict(self.seconds_per('method')),
+            'counters': dict(self.counters),
+            'peak_memory_mb': peak_memory_mb(),
+            'records': self.records
+        }
+
+        with open(json_file, "w") as f:
+            json.dump(profile, f, indent=1)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+###     Incremental cache of benchmark results
+###     Evaluation metrics per protein and method are stored together with
+###     fingerprints of the input files (contact matrix and PDB file), so that
+###     repeated benchmark runs only evaluate new or modified predictions.
+# ===============================================================================
+
+### load libraries
+import hashlib
+import json
+import os
+import matrix_io
+
+
+def file_fingerprint(file_path, content_hash=False):
+    """
+    Fingerprint of a file: size and modification time or a hash of the file content
+
+    :param file_path: path to file
+    :param content_hash: use sha1 hash of file content instead of size and modification time
+    :return: list
+    """
+
+    # matrices in an archive are identified by the hash stored in the archive index
+    if matrix_io.is_archive_member(file_path):
+        return [matrix_io.read_archive_entry(file_path)['sha1']]
+
+    if content_hash:
+        sha1 = hashlib.sha1()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha1.update(block)
+        return [sha1.hexdigest()]
+
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class ResultsCache():
+    """
+    On-disk cache of evaluation metrics with one JSON file per protein
+    """
+
+    def __init__(self, cache_dir, content_hash=False):
+        self.cache_dir = cache_dir
+        self.content_hash = content_hash
+
+    def __cache_file(self, protein):
+        return os.path.join(self.cache_dir, protein + ".json")
+
+    def __read(self, protein):
+
+        cache_file = self.__cache_file(protein)
+        if not os.path.exists(cache_file):
+            return {}
+
+        try:
+            with open(cache_file) as f:
+                return json.load(f)
+        except ValueError:
+            print("Ignore corrupt results cache file {0}".format(cache_file))
+            return {}
+
+    def __write(self, protein, entries):
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+        matrix_io.replace_atomically(self.__cache_file(protein), lambda f: json.dump(entries, f), mode="w")
+
+    def __entry_key(self, pdb_fingerprint, mat_file, mat_fingerprint, settings):
+
+        # the path (or archive member name) is part of the key: fingerprints of
+        # different files can be equal (same size and modification time)
+        key = json.dumps([pdb_fingerprint, os.path.abspath(mat_file), mat_fingerprint, settings], sort_keys=True)
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def lookup(self, protein, pdb_file, mat_files, settings):
+        """
+        Get cached evaluation metrics for methods whose input files did not change
+
+        :param protein: protein name
+        :param pdb_file: path to PDB file
+        :param mat_files: dictionary mapping method names to contact matrix files
+        :param settings: dictionary of evaluation settings (seqsep, thresholds, ranks, ...)
+        :return: dictionary mapping method names to cached evaluation metrics
+        """
+
+        entries = self.__read(protein)
+        if len(entries) == 0:
+            return {}
+
+        pdb_fingerprint = file_fingerprint(pdb_file, self.content_hash)
+
+        cached_metrics = {}
+        for method_name, mat_file in mat_files.items():
+            key = self.__entry_key(pdb_fingerprint, mat_file, file_fingerprint(mat_file, self.content_hash), settings)
+            if key in entries:
+                cached_metrics[method_name] = entries[key]['metrics']
+
+        return cached_metrics
+
+    def store(self, protein, pdb_file, mat_files, settings, metrics):
+        """
+        Store evaluation metrics and remove entries of outdated input files
+
+        :param protein: protein name
+        :param pdb_file: path to PDB file
+        :param mat_files: dictionary mapping method names to contact matrix files
+        :param settings: dictionary of evaluation settings (seqsep, thresholds, ranks, ...)
+        :param metrics: dictionary mapping method names to evaluation metrics
+        :return:
+        """
+
+        pdb_fingerprint = file_fingerprint(pdb_file, self.content_hash)
+        mat_fingerprints = {
+            os.path.abspath(mat_file): file_fingerprint(mat_file, self.content_hash)
+            for mat_file in mat_files.values()}
+
+        # drop entries computed from an older version of the PDB file or of one of the matrix files
+        entries = {
+            key: entry for key, entry in self.__read(protein).items()
+            if entry['pdb_fingerprint'] == pdb_fingerprint and
+               mat_fingerprints.get(entry['mat_file'], entry['mat_fingerprint']) == entry['mat_fingerprint']
+        }
+
+        for method_name, method_metrics in metrics.items():
+            mat_file = os.path.abspath(mat_files[method_name])
+            key = self.__entry_key(pdb_fingerprint, mat_file, mat_fingerprints[mat_file], settings)
+            entries[key] = {
+                'mat_file': mat_file,
+                'mat_fingerprint': mat_fingerprints[mat_file],
+                'pdb_fingerprint': pdb_fingerprint,
+                'settings': settings,
+                'metrics': method_metrics
+            }
+
+        self.__write(protein, entries)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+###     Compact scatter plots of residue pair scores
+###     Plotting all L*(L-1)/2 residue pairs of large proteins produces huge
+###     html files. In compact mode, the highest and lowest scoring pairs are
+###     always kept while the dense bulk is thinned out on a 2D grid, residue
+###     indices are stored as numbers (customdata) instead of hover strings,
+###     and arrays are written as typed arrays (plotly >= 6) or rounded.
+# ===============================================================================
+
+### load libraries
+import numpy as np
+import plotly
+import plotly.graph_objs as go
+
+try:
+    TYPED_ARRAYS = int(plotly.__version__.split(".")[0]) >= 6
+except (AttributeError, ValueError):
+    TYPED_ARRAYS = False
+
+
+def downsample_scatter(x, y, max_points=20000, nr_extreme=500, bins=200, seed=0):
+    """
+    Select points of a scatter plot: extreme points are kept, dense regions are thinned out
+
+    The nr_extreme highest and lowest points along both axes are always kept. The remaining
+    points are binned on a bins x bins grid and every grid cell keeps at most as many points
+    as fit into the budget of max_points, so sparse regions and outliers are kept completely.
+
+    :param x: x values
+    :param y: y values
+    :param max_points: approximate number of selected points
+    :param nr_extreme: number of highest and lowest points along both axes that are kept
+    :param bins: number of grid cells along each axis
+    :param seed: seed of the random number generator
+    :return: sorted indices of selected points
+    """
+
+    x = np.asarray(x)
+    y = np.asarray(y)
+    nr_points = len(x)
+    if nr_points <= max_points:
+        return np.arange(nr_points)
+
+    keep = np.zeros(nr_points, dtype=bool)
+    nr_extreme = min(nr_extreme, nr_points // 2)
+    if nr_extreme > 0:
+        for values in (x, y):
+            keep[np.argpartition(values, nr_extreme - 1)[:nr_extreme]] = True
+            keep[np.argpartition(values, nr_points - nr_extreme)[nr_points - nr_extreme:]] = True
+
+    # assign the remaining points to grid cells
+    remaining = np.flatnonzero(~keep)
+    budget = max_points - np.sum(keep)
+    if budget <= 0 or len(remaining) == 0:
+        return np.flatnonzero(keep)
+
+    def grid_index(values):
+        low, high = np.min(values), np.max(values)
+        if high <= low:
+            return np.zeros(len(values), dtype=np.int64)
+        return np.minimum(((values - low) / (high - low) * bins).astype(np.int64), bins - 1)
+
+    cells = grid_index(x[remaining]) * bins + grid_index(y[remaining])
+    counts = np.bincount(cells, minlength=bins * bins)
+
+    # largest number of points per cell that fits into the budget
+    low, high = 0, int(np.max(counts))
+    while low < high:
+        cap = (low + high + 1) // 2
+        if np.sum(np.minimum(counts, cap)) <= budget:
+            low = cap
+        else:
+            high = cap - 1
+    cap = low
+
+    # keep a random subset of at most cap points per cell
+    rng = np.random.RandomState(seed)
+    order = np.lexsort((rng.random_sample(len(cells)), cells))
+    sorted_cells = cells[order]
+    first_in_cell = np.searchsorted(sorted_cells, sorted_cells, side='left')
+    rank_in_cell = np.arange(len(sorted_cells)) - first_in_cell
+    keep[remaining[order[rank_in_cell < cap]]] = True
+
+    return np.flatnonzero(keep)
+
+
+def downsample_curve(nr_points, max_points=20000, nr_extreme=500):
+    """
+    Select points of a monotone curve (e.g. a QQ plot): both tails are kept, the rest is evenly spaced
+
+    :param nr_points: number of points of the curve
+    :param max_points: approximate number of selected points
+    :param nr_extreme: number of points kept at both ends
+    :return: sorted indices of selected points
+    """
+
+    if nr_points <= max_points:
+        return np.arange(nr_points)
+
+    nr_extreme = min(nr_extreme, max_points // 2)
+    keep = np.zeros(nr_points, dtype=bool)
+    keep[:nr_extreme] = True
+    keep[nr_points - nr_extreme:] = True
+    keep[np.linspace(0, nr_points - 1, max(max_points - 2 * nr_extreme, 2)).astype(np.int64)] = True
+
+    return np.flatnonzero(keep)
+
+
+def encode_array(values, significant_digits=5):
+    """
+    Compact representation of a numeric array for plotly traces
+
+    :param values: numeric array
+    :param significant_digits: precision of floating point values without typed arrays
+    :return: float32 or integer array (typed arrays) or rounded array
+    """
+
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.integer):
+        return values.astype(np.uint16 if values.size == 0 or np.max(values) < 2**16 else np.uint32)
+
+    if TYPED_ARRAYS:
+        return values.astype(np.float32)
+
+    # without typed arrays, values are written as decimal numbers: do not write more digits than needed
+    finite = values[np.isfinite(values)]
+    magnitude = np.max(np.abs(finite)) if len(finite) > 0 else 0
+    decimals = significant_digits - 1 - (int(np.floor(np.log10(magnitude))) if magnitude > 0 else 0)
+    return np.round(values.astype(np.float64), decimals=max(decimals, 0))
+
+
+def compact_pair_scatter(x, y, indices_i, indices_j, hover_labels=("x", "y"), marker=None, selected=None):
+    """
+    Scattergl trace of residue pairs with numeric pair indices instead of hover strings
+
+    :param x: x values
+    :param y: y values
+    :param indices_i: residue indices i (0-based)
+    :param indices_j: residue indices j (0-based)
+    :param hover_labels: names of x and y values in the hover text
+    :param marker: plotly marker dictionary
+    :param selected: indices of points that are plotted (default: all)
+    :return: go.Scattergl
+    """
+
+    if selected is None:
+        selected = np.arange(len(x))
+
+    customdata = np.column_stack([np.asarray(indices_i)[selected] + 1, np.asarray(indices_j)[selected] + 1])
+
+    return go.Scattergl(
+        x=encode_array(np.asarray(x)[selected]),
+        y=encode_array(np.asarray(y)[selected]),
+        customdata=encode_array(customdata),
+        mode='markers',
+        marker=marker if marker is not None else {},
+        hovertemplate="i: %{customdata[0]}<br>j: %{customdata[1]}<br>" +
+                      hover_labels[0] + ": %{x}<br>" + hover_labels[1] + ": %{y}<extra></extra>",
+        showlegend=False
+    )
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+###     Blocked, multithreaded sequence weighting of large alignments
+###     Computes the same weights as ccmpred.weighting.weights_simple:
+###     w_n = 1 / (1 + number of other sequences with at least
+###     ceil(cutoff * L) identical positions).
+###     Sequences are one-hot encoded per block of rows and the pairwise
+###     identities of every tile of two row blocks are computed as a matrix
+###     product, so memory is bounded by the block size and tiles are
+###     distributed over a thread pool (numpy releases the GIL in BLAS).
+# ===============================================================================
+
+### load libraries
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+GAP = 20
+
+
+def one_hot(alignment, nr_states):
+    """
+    One-hot encoding of a block of sequences
+
+    :param alignment: B x L alignment (integer encoded)
+    :param nr_states: number of encoded states (states >= nr_states are dropped)
+    :return: B x (L * nr_states) float32 matrix
+    """
+
+    nr_rows, L = alignment.shape
+    encoded = np.zeros((nr_rows, L, nr_states), dtype=np.float32)
+    rows, columns = np.nonzero(alignment < nr_states)
+    encoded[rows, columns, alignment[rows, columns]] = 1
+    return encoded.reshape(nr_rows, L * nr_states)
+
+
+def _count_neighbours(alignment, cutoff, ignore_gaps, block_i, block_j, block_size):
+
+    # number of neighbours of the sequences of row block i in row block j and vice versa
+    rows_i = alignment[block_i * block_size:(block_i + 1) * block_size]
+    rows_j = alignment[block_j * block_size:(block_j + 1) * block_size]
+    L = alignment.shape[1]
+
+    # amino acids (and gaps unless they are ignored) count as identities
+    nr_states = GAP if ignore_gaps else GAP + 1
+    identities = np.dot(one_hot(rows_i, nr_states), one_hot(rows_j, nr_states).T)
+
+    if ignore_gaps:
+        # positions with gaps in both sequences are not compared
+        gaps_i = (rows_i == GAP).astype(np.float32)
+        gaps_j = (rows_j == GAP).astype(np.float32)
+        threshold = np.ceil(cutoff * (L - np.dot(gaps_i, gaps_j.T).astype(np.float64)))
+    else:
+        threshold = np.ceil(cutoff * L)
+
+    neighbours = identities >= threshold
+    if block_i == block_j:
+        np.fill_diagonal(neighbours, False)
+
+    return block_i, block_j, np.sum(neighbours, axis=1), np.sum(neighbours, axis=0)
+
+
+def weights_simple(alignment, cutoff=0.8, ignore_gaps=False, block_size=1024, num_threads=1):
+    """
+    Sequence weights as ccmpred.weighting.weights_simple computed in tiles of sequence pairs
+
+    :param alignment: N x L alignment (integer encoded, gaps = 20)
+    :param cutoff: fraction of identical positions above which two sequences are neighbours
+    :param ignore_gaps: do not count positions with gaps in both sequences
+    :param block_size: number of sequences per block (bounds the memory used per tile)
+    :param num_threads: number of threads computing tiles
+    :return: N weights (float64)
+    """
+
+    alignment = np.asarray(alignment)
+    nr_sequences = alignment.shape[0]
+    if cutoff >= 1:
+        return np.ones(nr_sequences, dtype=np.float64)
+
+    nr_blocks = (nr_sequences + block_size - 1) // block_size
+    tiles = [(block_i, block_j) for block_i in range(nr_blocks) for block_j in range(block_i, nr_blocks)]
+
+    neighbours = np.zeros(nr_sequences, dtype=np.int64)
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        results = executor.map(
+            lambda tile: _count_neighbours(alignment, cutoff, ignore_gaps, tile[0], tile[1], block_size), tiles)
+        for block_i, block_j, neighbours_i, neighbours_j in results:
+            neighbours[block_i * block_size:(block_i + 1) * block_size] += neighbours_i
+            if block_i != block_j:
+                neighbours[block_j * block_size:(block_j + 1) * block_size] += neighbours_j
+
+    return 1.0 / (1 + neighbours)
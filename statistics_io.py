@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+###     Columnar storage of benchmark evaluation statistics
+###     One row per protein, method and rank with columns for precision,
+###     recall and mean error. Files are written as Parquet if pyarrow is
+###     available and as compressed .npz otherwise.
+# ===============================================================================
+
+### load libraries
+import json
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+METRICS = ['precision', 'recall', 'mean_error']
+META_KEY = b"ccmgen_evaluation_statistics"
+
+
+def default_extension():
+    return ".parquet" if pyarrow is not None else ".npz"
+
+
+def _to_columns(evaluation_statistics):
+
+    columns = {'protein': [], 'method': [], 'rank_index': [], 'rank': []}
+    columns.update({metric: [] for metric in METRICS})
+
+    ranks = np.asarray(evaluation_statistics['ranks'])
+    for protein, protein_eval_metrics in evaluation_statistics['proteins'].items():
+        for method_name in evaluation_statistics['methods']:
+            metrics = protein_eval_metrics[method_name]
+            nr_ranks = len(metrics['precision'])
+
+            columns['protein'].extend([protein] * nr_ranks)
+            columns['method'].extend([method_name] * nr_ranks)
+            columns['rank_index'].extend(range(nr_ranks))
+            columns['rank'].extend(ranks[:nr_ranks])
+            for metric in METRICS:
+                columns[metric].extend(metrics[metric])
+
+    columns['protein'] = np.array(columns['protein'], dtype=str)
+    columns['method'] = np.array(columns['method'], dtype=str)
+    columns['rank_index'] = np.array(columns['rank_index'], dtype=np.int32)
+    for key in ['rank'] + METRICS:
+        columns[key] = np.array(columns[key], dtype=np.float64)
+
+    return columns
+
+
+def _from_columns(columns, meta):
+
+    evaluation_statistics = {
+        'contact_thr': meta['contact_thr'],
+        'noncontact_thr': meta['noncontact_thr'],
+        'seqsep': meta['seqsep'],
+        'ranks': np.array(meta['ranks']),
+        'methods': meta['methods'],
+        'proteins': {}
+    }
+
+    # rows are written grouped by protein and method and ordered by rank
+    protein_column = columns['protein']
+    method_column = columns['method']
+    nr_rows = len(protein_column)
+    if nr_rows == 0:
+        return evaluation_statistics
+
+    new_group = np.ones(nr_rows, dtype=bool)
+    new_group[1:] = (protein_column[1:] != protein_column[:-1]) | (method_column[1:] != method_column[:-1])
+    starts = np.flatnonzero(new_group)
+    ends = np.append(starts[1:], nr_rows)
+
+    proteins = evaluation_statistics['proteins']
+    for start, end in zip(starts, ends):
+        protein = str(protein_column[start])
+        method_name = str(method_column[start])
+        proteins.setdefault(protein, {})[method_name] = {
+            metric: columns[metric][start:end].tolist() for metric in METRICS}
+
+    return evaluation_statistics
+
+
+def write_evaluation_statistics(evaluation_statistics, file_path):
+    """
+    Write evaluation statistics of a Benchmark to a Parquet (.parquet) or numpy (.npz) file
+
+    :param evaluation_statistics: Benchmark.evaluation_statistics
+    :param file_path: path to output file
+    :return:
+    """
+
+    columns = _to_columns(evaluation_statistics)
+    meta = {
+        'contact_thr': evaluation_statistics['contact_thr'],
+        'noncontact_thr': evaluation_statistics['noncontact_thr'],
+        'seqsep': evaluation_statistics['seqsep'],
+        'ranks': np.asarray(evaluation_statistics['ranks']).tolist(),
+        'methods': list(evaluation_statistics['methods'])
+    }
+
+    if file_path.endswith(".parquet"):
+        if pyarrow is None:
+            raise ImportError("Writing Parquet files requires pyarrow. Use a .npz file instead.")
+        table = pyarrow.table(columns)
+        table = table.replace_schema_metadata({META_KEY: json.dumps(meta).encode("utf-8")})
+        pyarrow.parquet.write_table(table, file_path)
+    else:
+        with open(file_path, "wb") as f:
+            np.savez_compressed(f, meta=np.array(json.dumps(meta)), **columns)
+
+
+def read_evaluation_statistics(file_path):
+    """
+    Read evaluation statistics written with write_evaluation_statistics
+
+    :param file_path: path to Parquet (.parquet) or numpy (.npz) file
+    :return: evaluation statistics in the format of Benchmark.evaluation_statistics
+    """
+
+    if file_path.endswith(".parquet"):
+        if pyarrow is None:
+            raise ImportError("Reading Parquet files requires pyarrow.")
+        table = pyarrow.parquet.read_table(file_path)
+        meta = json.loads(table.schema.metadata[META_KEY].decode("utf-8"))
+        columns = {name: table.column(name).to_numpy() for name in table.column_names}
+    else:
+        with np.load(file_path, allow_pickle=False) as npz:
+            meta = json.loads(str(npz['meta']))
+            columns = {name: npz[name] for name in npz.files if name != 'meta'}
+
+    return _from_columns(columns, meta)